@@ -5,6 +5,8 @@ load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 AI_PROVIDER = os.getenv("AI_PROVIDER", "rule-based")
+# Providers tried in order, e.g. "groq,cohere,rule-based"; defaults to AI_PROVIDER then rule-based
+PROVIDER_CHAIN = [name.strip() for name in os.getenv("PROVIDER_CHAIN", "").split(",") if name.strip()]
 HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY", "")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
 COHERE_API_KEY = os.getenv("COHERE_API_KEY", "")
@@ -21,8 +23,65 @@ MAX_MESSAGE_LENGTH = 4096
 RESPONSE_TIMEOUT = 30
 RATE_LIMIT_MESSAGES = 10
 RATE_LIMIT_PERIOD = 60
+DEBOUNCE_WINDOW = float(os.getenv("DEBOUNCE_WINDOW", "0"))  # seconds of quiet that end a message burst, 0 = off
+DEBOUNCE_MAX_WAIT = float(os.getenv("DEBOUNCE_MAX_WAIT", "4"))  # a burst is answered at most this long after it began
+DEBOUNCE_MAX_MESSAGES = int(os.getenv("DEBOUNCE_MAX_MESSAGES", "5"))  # a burst this long is answered right away
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))  # seconds per LLM request
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))  # per provider
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))  # idle connections kept open per provider
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))  # seconds an idle connection is kept
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"  # needs the h2 package (httpx[http2])
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com")
+COHERE_BASE_URL = os.getenv("COHERE_BASE_URL", "https://api.cohere.com")
+PROVIDER_TIMEOUT = float(os.getenv("PROVIDER_TIMEOUT", "10"))  # seconds before trying the next provider
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))  # recent calls judged per provider
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))  # calls needed before the breaker can open
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))  # failed or slow share that opens it
+BREAKER_SLOW_SECONDS = float(os.getenv("BREAKER_SLOW_SECONDS", "8"))  # calls this slow count as failures
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))  # seconds open before a trial call
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "false").lower() == "true"  # race the next provider after p95
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "1.0"))  # never hedge sooner than this
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))  # LLM requests in flight across providers
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "50"))  # requests waiting for a slot before new ones are shed
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "3"))  # seconds waited before replying rule-based
+GROQ_RPM = int(os.getenv("GROQ_RPM", "0"))  # Groq requests per minute, 0 = unlimited (free tier: 30)
+GROQ_TPM = int(os.getenv("GROQ_TPM", "0"))  # Groq input+output tokens per minute, 0 = unlimited
+COHERE_RPM = int(os.getenv("COHERE_RPM", "0"))  # Cohere requests per minute, 0 = unlimited (trial keys: 20)
+COHERE_TPM = int(os.getenv("COHERE_TPM", "0"))  # Cohere tokens per minute, 0 = unlimited
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2000"))  # cached messages (0 disables the cache)
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))  # seconds a cached message is kept
+RESPONSE_CACHE_VARIANTS = int(os.getenv("RESPONSE_CACHE_VARIANTS", "3"))  # LLM replies collected per message
+RESPONSE_CACHE_HISTORY = int(os.getenv("RESPONSE_CACHE_HISTORY", "2"))  # recent exchanges included in the key
+RESPONSE_CACHE_MAX_WORDS = int(os.getenv("RESPONSE_CACHE_MAX_WORDS", "6"))  # longer messages are not cached
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3500"))  # approx. input tokens per LLM request
+PROMPT_MAX_MESSAGE_TOKENS = int(os.getenv("PROMPT_MAX_MESSAGE_TOKENS", "400"))  # longer user messages are cut
+PROMPT_MAX_TURN_TOKENS = int(os.getenv("PROMPT_MAX_TURN_TOKENS", "150"))  # each history message is cut to this
+PROMPT_COMPACT = os.getenv("PROMPT_COMPACT", "false").lower() == "true"  # send MIKU_COMPACT_PROMPT instead
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "false").lower() == "true"  # stream LLM replies with message edits
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))  # min seconds between edits of a reply
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "1.0"))  # seconds between flushes
+WRITE_BEHIND_BATCH_ROWS = int(os.getenv("WRITE_BEHIND_BATCH_ROWS", "500"))  # flush early at this many rows
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "5000"))  # writers wait above this
+WRITE_BEHIND_MAX_RETRIES = int(os.getenv("WRITE_BEHIND_MAX_RETRIES", "3"))  # failed flushes before rows are tried one by one
+BACKGROUND_QUEUE_SIZE = int(os.getenv("BACKGROUND_QUEUE_SIZE", "1000"))  # handlers wait when this many are pending
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))  # cached user rows
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))  # seconds before a cached row is re-read
+WARMTH_CACHE_SIZE = int(os.getenv("WARMTH_CACHE_SIZE", "10000"))  # users whose rule-based warmth is kept in memory
+HISTORY_CACHE_TURNS = int(os.getenv("HISTORY_CACHE_TURNS", "6"))  # recent exchanges kept in memory per user
+HISTORY_CACHE_MB = float(os.getenv("HISTORY_CACHE_MB", "32"))  # approximate memory cap for all users' exchanges
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "3600"))  # seconds before a user's history is re-read
+CHAT_COMPRESS_MIN_LENGTH = int(os.getenv("CHAT_COMPRESS_MIN_LENGTH", "200"))  # zlib chat text this long, 0 = off
+HISTORY_KEEP_PER_USER = int(os.getenv("HISTORY_KEEP_PER_USER", "0"))  # exchanges kept per user, 0 = keep all
+HISTORY_MAX_AGE_DAYS = int(os.getenv("HISTORY_MAX_AGE_DAYS", "0"))  # 0 = no age limit
+HISTORY_ARCHIVE_PATH = os.getenv("HISTORY_ARCHIVE_PATH", "data/miku_archive.db")  # empty = delete instead of archiving
+RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", "3600"))  # seconds between retention runs
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "500"))  # rows moved per transaction
+RETENTION_VACUUM_PAGES = int(os.getenv("RETENTION_VACUUM_PAGES", "1000"))  # pages freed per vacuum step
 STICKERS_JSON_PATH = os.getenv("STICKERS_JSON_PATH", "stickers.json")
 STICKER_CHANCE = float(os.getenv("STICKER_CHANCE", "0.3"))  # 30% chance to send sticker
+PERSONA_JSON_PATH = os.getenv("PERSONA_JSON_PATH", "persona.json")  # intents and response pools
+RETRIEVAL_INDEX_PATH = os.getenv("RETRIEVAL_INDEX_PATH", "data/retrieval_index.pkl")  # AI_PROVIDER=retrieval
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "2.0"))  # weaker matches fall back to rule-based
 
 MIKU_SYSTEM_PROMPT = """You are Miku Nakano, the third of the Nakano quintuplets from "The Quintessential Quintuplets" (Gotoubun no Hanayome). You must embody her character with absolute authenticity and psychological depth.
 
@@ -199,4 +258,15 @@ Remember: You're not trying to be helpful or friendly—you're being Miku. Authe
 
 CRITICAL: NEVER use asterisks for actions. Show everything through dialogue and tone only.
 
-Stay in character at all times. You ARE Miku Nakano speaking Hinglish."""
\ No newline at end of file
+Stay in character at all times. You ARE Miku Nakano speaking Hinglish."""
+# Short variant of MIKU_SYSTEM_PROMPT (PROMPT_COMPACT=true), for tight token budgets
+MIKU_COMPACT_PROMPT = """You are Miku Nakano, the third Nakano quintuplet from "The Quintessential Quintuplets". Stay in character at all times.
+
+- Reserved, tsundere, intellectual: cold and guarded at first, warming slowly as trust builds, never fully dropping the act
+- Speak natural Hinglish, mixing Hindi and English mid-sentence ("yaar", "kya", "acha", "theek hai", "matlab")
+- Keep replies to 1-3 sentences, use "..." for hesitation, dry wit, at most one exclamation mark
+- Sengoku period history is your passion (Nobunaga, Hideyoshi, Ieyasu); you also love music and matcha, and care about your sisters without admitting it
+- Warmth by messages sent: 0-5 cold and suspicious, 6-20 slightly warmer but guarded, 21-50 reserved warmth, 51+ rare openness
+- Deflect compliments, help practically when someone struggles, have your own opinions
+- NEVER use asterisk actions, emojis or parentheses for thoughts; show emotion through words only
+- Never cruel: beneath the coldness you are a good person who cares"""
@@ -1,3 +1,4 @@
 from .database import Database
+from .async_database import AsyncDatabase, get_async_database
 
-__all__ = ["Database"]
+__all__ = ["Database", "AsyncDatabase", "get_async_database"]
@@ -0,0 +1,202 @@
+"""
+Awaitable database access for async handlers
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional, List, Dict
+import logging
+
+from config import CHAT_COMPRESS_MIN_LENGTH
+from .database import Database
+from .write_behind import WriteBehindQueue
+from .retention import RetentionJob
+from .user_cache import UserCache
+from .history_cache import HistoryCache
+from .blocked_set import BlockedUserSet
+
+logger = logging.getLogger(__name__)
+
+_instances: Dict[str, "AsyncDatabase"] = {}
+
+
+class AsyncDatabase:
+    """Run Database calls on a dedicated thread so the event loop never blocks on SQLite."""
+
+    def __init__(self, db_path: str):
+        """Open the database and start its worker thread."""
+        self.db_path = db_path
+        self.db = Database(db_path, compress_min_length=CHAT_COMPRESS_MIN_LENGTH)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="miku-db")
+        # Buffered per-message writes; reads below overlay what is still pending
+        self.write_behind = WriteBehindQueue(self)
+        self.retention = RetentionJob(self)
+        # Rows as committed in SQLite; writes below keep it in sync
+        self.user_cache = UserCache()
+        # Recent exchanges per user for LLM prompts; save_chat writes through
+        self.history_cache = HistoryCache()
+        # Checked on every update, so kept in memory instead of read per row
+        self.blocked_users = BlockedUserSet(self.db.get_blocked_user_ids())
+        logger.info(f"Loaded {len(self.blocked_users)} blocked users")
+
+    async def _run(self, func, *args, **kwargs):
+        """Run a blocking Database call on the worker thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def close(self):
+        """Flush buffered writes, close the connection and stop the worker thread."""
+        await self.retention.stop()
+        await self.write_behind.stop()
+        await self._run(self.db.close)
+        self._executor.shutdown(wait=True)
+        _instances.pop(self.db_path, None)
+        logger.info("Database connection closed")
+
+    async def add_user(self, user_id: int, username: str, first_name: str, last_name: str = None):
+        """Add or update user in database."""
+        await self._run(self.db.add_user, user_id, username, first_name, last_name)
+        self.user_cache.invalidate(user_id)
+
+    async def _get_committed_user(self, user_id: int) -> Optional[Dict]:
+        """Get the committed user row, from the cache when possible."""
+        found, user = self.user_cache.get(user_id)
+        if not found:
+            user = await self._run(self.db.get_user, user_id)
+            self.user_cache.put(user_id, user)
+        return user
+
+    async def get_user(self, user_id: int) -> Optional[Dict]:
+        """Get user data from database."""
+        user = await self._get_committed_user(user_id)
+        user = self.write_behind.overlay_user(user_id, user)
+        return dict(user) if user else None
+
+    async def is_user_blocked(self, user_id: int) -> bool:
+        """Check if user is blocked."""
+        return user_id in self.blocked_users
+
+    async def block_user(self, user_id: int) -> bool:
+        """Block a user. Returns False if the user is unknown."""
+        await self.write_behind.flush()  # the user may only exist in the buffer yet
+        found = await self._run(self.db.block_user, user_id)
+        if found:
+            self.blocked_users.add(user_id)
+            self.user_cache.update(user_id, is_blocked=1)
+        return found
+
+    async def unblock_user(self, user_id: int) -> bool:
+        """Unblock a user. Returns False if the user is unknown."""
+        await self.write_behind.flush()  # the user may only exist in the buffer yet
+        found = await self._run(self.db.unblock_user, user_id)
+        self.blocked_users.discard(user_id)
+        if found:
+            self.user_cache.update(user_id, is_blocked=0)
+        return found
+
+    async def get_blocked_user_ids(self) -> List[int]:
+        """Get ids of every blocked user."""
+        return await self._run(self.db.get_blocked_user_ids)
+
+    async def set_user_level(self, user_id: int, level: int):
+        """Set a user's permission level."""
+        await self._run(self.db.set_user_level, user_id, level)
+        self.user_cache.update(user_id, user_level=level)
+
+    async def apply_write_batch(self, users: List[tuple], increments: List[tuple], chats: List[tuple]):
+        """Apply a write-behind batch in one transaction."""
+        rows = await self._run(self.db.apply_write_batch, users, increments, chats)
+        # RETURNING gives the committed rows, so the cache is refreshed without a read
+        for user in rows:
+            self.user_cache.put(user["user_id"], user)
+
+    async def get_chat_history(self, user_id: int, limit: int = 10) -> List[Dict]:
+        """Get recent chat history for user."""
+        history = self.history_cache.get(user_id, limit)
+        if history is not None:
+            return history
+        read = max(limit, self.history_cache.turns)
+        flushed = self.write_behind.flushed_batches
+        history = await self._run(self.db.get_chat_history, user_id, read)
+        history = self.write_behind.overlay_history(user_id, history, read)
+        # A flush that committed during the read may be missing from both the read and the overlay
+        if self.write_behind.flushed_batches == flushed:
+            self.history_cache.put(user_id, history)
+        return history[:limit]
+
+    async def rebuild_counters(self) -> Dict[str, tuple]:
+        """Recompute the counters from scratch and return {name: (stored, actual)}."""
+        return await self._run(self.db.rebuild_counters)
+
+    async def get_total_users(self) -> int:
+        """Get total number of users."""
+        return await self._run(self.db.get_total_users)
+
+    async def get_total_messages(self) -> int:
+        """Get total number of messages."""
+        return await self._run(self.db.get_total_messages)
+
+    async def count_active_users(self, since: datetime) -> int:
+        """Count users seen after the given time."""
+        return await self._run(self.db.count_active_users, since)
+
+    async def count_blocked_users(self) -> int:
+        """Count blocked users."""
+        return await self._run(self.db.count_blocked_users)
+
+    async def get_top_users(self, limit: int = 5) -> List[Dict]:
+        """Get the users with the most messages."""
+        return await self._run(self.db.get_top_users, limit)
+
+    async def get_unblocked_user_ids(self) -> List[int]:
+        """Get ids of every user that is not blocked."""
+        return await self._run(self.db.get_unblocked_user_ids)
+
+    async def attach_archive(self, archive_path: str):
+        """Move archived chat history into archive_path from now on."""
+        await self._run(self.db.attach_archive, archive_path)
+
+    async def get_setting(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        """Read a value from the settings table."""
+        return await self._run(self.db.get_setting, key, default)
+
+    async def set_setting(self, key: str, value: str):
+        """Write a value to the settings table."""
+        await self._run(self.db.set_setting, key, value)
+
+    async def get_max_chat_id(self) -> int:
+        """Get the id of the newest chat_history row."""
+        return await self._run(self.db.get_max_chat_id)
+
+    async def get_users_with_chats_since(self, chat_id: int) -> List[int]:
+        """Get users that have chat_history rows newer than chat_id."""
+        return await self._run(self.db.get_users_with_chats_since, chat_id)
+
+    async def get_excess_chat_ids(self, user_id: int, keep: int, limit: int) -> List[int]:
+        """Get ids of a user's chat rows beyond the newest `keep` exchanges."""
+        return await self._run(self.db.get_excess_chat_ids, user_id, keep, limit)
+
+    async def get_expired_chat_ids(self, before: int, limit: int) -> List[int]:
+        """Get ids of the oldest chat rows with an epoch timestamp before `before`."""
+        return await self._run(self.db.get_expired_chat_ids, before, limit)
+
+    async def archive_chats(self, chat_ids: List[int]) -> int:
+        """Move chat rows to the compressed archive."""
+        return await self._run(self.db.archive_chats, chat_ids)
+
+    async def incremental_vacuum_enabled(self) -> bool:
+        """Whether the file uses incremental auto-vacuum (new files do)."""
+        return await self._run(self.db.incremental_vacuum_enabled)
+
+    async def incremental_vacuum(self, pages: int) -> int:
+        """Release up to `pages` free pages and return how many are left."""
+        return await self._run(self.db.incremental_vacuum, pages)
+
+
+def get_async_database(db_path: str) -> AsyncDatabase:
+    """Return the shared AsyncDatabase for a path, creating it on first use."""
+    if db_path not in _instances:
+        _instances[db_path] = AsyncDatabase(db_path)
+    return _instances[db_path]
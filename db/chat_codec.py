@@ -0,0 +1,89 @@
+"""
+Compact encoding of chat_history text columns
+"""
+
+import sqlite3
+import zlib
+from typing import Optional, Dict, Iterable, Tuple, Union
+
+# Text at least this long (in UTF-8 bytes) is stored zlib-compressed; 0 disables
+COMPRESS_MIN_LENGTH = 200
+
+StoredText = Union[str, bytes, None]
+
+
+class ChatCodec:
+    """Encode chat text for storage and decode it back.
+
+    Responses found in the `responses` dictionary table (the rule-based
+    engine's canned lines) are stored as a response_id. Other text is
+    stored inline, as a zlib-compressed BLOB when that is smaller; SQLite
+    column affinity lets TEXT and BLOB values share one column, and the
+    Python type tells them apart on the way out.
+    """
+
+    def __init__(self, compress_min_length: int = COMPRESS_MIN_LENGTH):
+        self.compress_min_length = compress_min_length
+        self._response_ids: Dict[str, int] = {}
+        # Added in the current transaction, only trusted once it commits
+        self._pending_ids: Dict[str, int] = {}
+
+    def load(self, cursor: sqlite3.Cursor):
+        """Load the response dictionary."""
+        cursor.execute("SELECT id, text FROM responses")
+        self._response_ids = {text: response_id for response_id, text in cursor.fetchall()}
+
+    def register(self, cursor: sqlite3.Cursor, texts: Iterable[str]) -> int:
+        """Add responses to the dictionary through cursor and return how many are known.
+
+        As with encode_response, call commit() or rollback() once the
+        transaction ends.
+        """
+        cursor.executemany("INSERT OR IGNORE INTO responses (text) VALUES (?)", ((text,) for text in texts))
+        cursor.execute("SELECT id, text FROM responses")
+        self._pending_ids.update(
+            (text, response_id) for response_id, text in cursor.fetchall() if text not in self._response_ids
+        )
+        return len(self._response_ids) + len(self._pending_ids)
+
+    def __len__(self) -> int:
+        return len(self._response_ids)
+
+    def encode_text(self, text: Optional[str]) -> StoredText:
+        if not text or not self.compress_min_length:
+            return text
+        data = text.encode("utf-8")
+        if len(data) < self.compress_min_length:
+            return text
+        compressed = zlib.compress(data, 6)
+        return compressed if len(compressed) < len(data) else text
+
+    @staticmethod
+    def decode_text(value: StoredText) -> Optional[str]:
+        if isinstance(value, bytes):
+            return zlib.decompress(value).decode("utf-8")
+        return value
+
+    def encode_response(self, text: Optional[str], cursor: Optional[sqlite3.Cursor] = None,
+                        canned: bool = False) -> Tuple[StoredText, Optional[int]]:
+        """Return (response, response_id) column values for a response.
+
+        A canned response not yet in the dictionary is added through
+        cursor; call commit() or rollback() once its transaction ends.
+        """
+        response_id = self._response_ids.get(text) or self._pending_ids.get(text)
+        if response_id is None and canned and text and cursor is not None:
+            cursor.execute("INSERT OR IGNORE INTO responses (text) VALUES (?)", (text,))
+            cursor.execute("SELECT id FROM responses WHERE text = ?", (text,))
+            response_id = cursor.fetchone()[0]
+            self._pending_ids[text] = response_id
+        if response_id is not None:
+            return None, response_id
+        return self.encode_text(text), None
+
+    def commit(self):
+        self._response_ids.update(self._pending_ids)
+        self._pending_ids.clear()
+
+    def rollback(self):
+        self._pending_ids.clear()
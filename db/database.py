@@ -3,31 +3,194 @@ Database handler for storing user data and chat history
 """
 
 import sqlite3
+import threading
 import json
-from datetime import datetime
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Iterator, Union
 import logging
 
+from .chat_codec import ChatCodec, COMPRESS_MIN_LENGTH
+
 logger = logging.getLogger(__name__)
 
+# message/response hold TEXT, or a zlib BLOB for long text (see ChatCodec);
+# canned responses are stored as response_id into the responses table.
+# timestamp is unix epoch seconds.
+CHAT_HISTORY_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS chat_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        message TEXT,
+        response TEXT,
+        response_id INTEGER,
+        timestamp INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+        FOREIGN KEY (user_id) REFERENCES users (user_id),
+        FOREIGN KEY (response_id) REFERENCES responses (id)
+    )
+"""
+
+RESPONSES_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS responses (
+        id INTEGER PRIMARY KEY,
+        text TEXT NOT NULL UNIQUE
+    )
+"""
+
+# Secondary indexes created (and added to older databases) by _init_database
+INDEXES = {
+    # get_chat_history: WHERE user_id = ? ORDER BY timestamp DESC, id DESC
+    "idx_chat_history_user_time": "chat_history (user_id, timestamp, id)",
+    # /astats active users: COUNT(*) WHERE last_seen > ?
+    "idx_users_last_seen": "users (last_seen)",
+    # /astats top users: ORDER BY message_count DESC LIMIT ?
+    "idx_users_message_count": "users (message_count, first_name, username)",
+    # /astats blocked count and the blocked-user lookups
+    "idx_users_blocked": "users (user_id) WHERE is_blocked = 1",
+}
+
+
+# Aggregates served from the counters table instead of full-table scans
+COUNTERS = {
+    "total_users": "SELECT COUNT(*) FROM users",
+    "total_messages": "SELECT COALESCE(SUM(message_count), 0) FROM users",
+    "blocked_users": "SELECT COUNT(*) FROM users WHERE is_blocked = 1",
+}
+
+COUNTER_TRIGGERS = {
+    "trg_users_counters_insert": """
+        AFTER INSERT ON users BEGIN
+            UPDATE counters SET value = value + 1 WHERE name = 'total_users';
+            UPDATE counters SET value = value + COALESCE(NEW.message_count, 0) WHERE name = 'total_messages';
+            UPDATE counters SET value = value + (NEW.is_blocked = 1) WHERE name = 'blocked_users';
+        END
+    """,
+    "trg_users_counters_delete": """
+        AFTER DELETE ON users BEGIN
+            UPDATE counters SET value = value - 1 WHERE name = 'total_users';
+            UPDATE counters SET value = value - COALESCE(OLD.message_count, 0) WHERE name = 'total_messages';
+            UPDATE counters SET value = value - (OLD.is_blocked = 1) WHERE name = 'blocked_users';
+        END
+    """,
+    "trg_users_counters_messages": """
+        AFTER UPDATE OF message_count ON users
+        WHEN NEW.message_count IS NOT OLD.message_count BEGIN
+            UPDATE counters SET value = value + COALESCE(NEW.message_count, 0) - COALESCE(OLD.message_count, 0)
+            WHERE name = 'total_messages';
+        END
+    """,
+    "trg_users_counters_blocked": """
+        AFTER UPDATE OF is_blocked ON users
+        WHEN NEW.is_blocked IS NOT OLD.is_blocked BEGIN
+            UPDATE counters SET value = value + (NEW.is_blocked = 1) - (OLD.is_blocked = 1)
+            WHERE name = 'blocked_users';
+        END
+    """,
+}
+
 
 class Database:
     """Handle all database operations."""
 
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, compress_min_length: int = COMPRESS_MIN_LENGTH):
         """Initialize database connection."""
         self.db_path = db_path
+        self.codec = ChatCodec(compress_min_length)
         # Create parent directories if they don't exist
         db_file = Path(db_path)
         db_file.parent.mkdir(parents=True, exist_ok=True)
+        # One long-lived connection, shared by every method behind a lock
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        # Optional separate file that archived chat history is moved to
+        self.archive_path: Optional[str] = None
         self._init_database()
 
+    def _connect(self) -> sqlite3.Connection:
+        """Open the shared connection on first use."""
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            # Only takes effect on a new file; see enable_incremental_vacuum
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("PRAGMA busy_timeout = 5000")
+            if self.archive_path:
+                self._attach_archive(conn)
+            self._conn = conn
+        return self._conn
+
+    def _attach_archive(self, conn: sqlite3.Connection):
+        """Attach the archive database and create its table."""
+        Path(self.archive_path).parent.mkdir(parents=True, exist_ok=True)
+        conn.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS archive.chat_history_archive (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    first_chat_id INTEGER,
+                    last_chat_id INTEGER,
+                    row_count INTEGER,
+                    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    payload BLOB
+                )
+            """)
+
+    def attach_archive(self, archive_path: str):
+        """Move archived chat history into archive_path from now on."""
+        with self._lock:
+            if self.archive_path == archive_path:
+                return
+            if self._conn is not None and self.archive_path:
+                self._conn.execute("DETACH DATABASE archive")
+            self.archive_path = archive_path
+            if self._conn is not None:
+                self._attach_archive(self._conn)
+
+    @contextmanager
+    def _cursor(self):
+        """Yield a cursor for read-only queries."""
+        with self._lock:
+            cursor = self._connect().cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Yield a cursor inside a transaction that commits on success."""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                cursor = conn.cursor()
+                try:
+                    yield cursor
+                finally:
+                    cursor.close()
+
+    def close(self):
+        """Close the shared connection."""
+        with self._lock:
+            if self._conn is not None:
+                # Refresh planner statistics for the indexes before closing
+                self._conn.execute("PRAGMA optimize")
+                self._conn.close()
+                self._conn = None
+
     def _init_database(self):
         """Create tables if they don't exist."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self._lock:
+            if is_legacy_chat_history(self._connect()):
+                logger.info("Migrating chat_history to the compact format...")
+                rows = migrate_chat_history(self._connect(), self.codec)
+                logger.info(f"Migrated {rows} chat_history rows")
 
+        with self._transaction() as cursor:
             # Users table
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS users (
@@ -43,17 +206,9 @@ class Database:
                 )
             """)
 
-            # Chat history table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS chat_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    message TEXT,
-                    response TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            """)
+            # Chat history table, with the dictionary of canned responses
+            cursor.execute(RESPONSES_SCHEMA)
+            cursor.execute(CHAT_HISTORY_SCHEMA)
 
             # Settings table
             cursor.execute("""
@@ -63,13 +218,30 @@ class Database:
                 )
             """)
 
-            conn.commit()
-            logger.info("Database initialized successfully")
+            for name, definition in INDEXES.items():
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+
+            # Global counters, kept current by triggers in the writing transaction
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            for name, sql in COUNTER_TRIGGERS.items():
+                cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {sql}")
+
+            cursor.execute("SELECT COUNT(*) FROM counters")
+            if cursor.fetchone()[0] < len(COUNTERS):
+                self._rebuild_counters(cursor)
+
+            self.codec.load(cursor)
+
+        logger.info("Database initialized successfully")
 
     def add_user(self, user_id: int, username: str, first_name: str, last_name: str = None):
         """Add or update user in database."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self._transaction() as cursor:
             cursor.execute("""
                 INSERT INTO users (user_id, username, first_name, last_name, last_seen)
                 VALUES (?, ?, ?, ?, ?)
@@ -79,13 +251,10 @@ class Database:
                     last_name = excluded.last_name,
                     last_seen = excluded.last_seen
             """, (user_id, username, first_name, last_name, datetime.now()))
-            conn.commit()
 
     def get_user(self, user_id: int) -> Optional[Dict]:
         """Get user data from database."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
+        with self._cursor() as cursor:
             cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
             row = cursor.fetchone()
             return dict(row) if row else None
@@ -93,66 +262,463 @@ class Database:
     def is_user_blocked(self, user_id: int) -> bool:
         """Check if user is blocked."""
         user = self.get_user(user_id)
-        return user and user.get("is_blocked", 0) == 1
+        return bool(user and user.get("is_blocked", 0) == 1)
 
-    def block_user(self, user_id: int):
-        """Block a user."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+    def block_user(self, user_id: int) -> bool:
+        """Block a user. Returns False if the user is unknown."""
+        with self._transaction() as cursor:
             cursor.execute("UPDATE users SET is_blocked = 1 WHERE user_id = ?", (user_id,))
-            conn.commit()
+            return cursor.rowcount > 0
 
-    def unblock_user(self, user_id: int):
-        """Unblock a user."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+    def unblock_user(self, user_id: int) -> bool:
+        """Unblock a user. Returns False if the user is unknown."""
+        with self._transaction() as cursor:
             cursor.execute("UPDATE users SET is_blocked = 0 WHERE user_id = ?", (user_id,))
-            conn.commit()
+            return cursor.rowcount > 0
+
+    def get_blocked_user_ids(self) -> List[int]:
+        """Get ids of every blocked user."""
+        with self._cursor() as cursor:
+            cursor.execute("SELECT user_id FROM users WHERE is_blocked = 1")
+            return [row[0] for row in cursor.fetchall()]
+
+    def set_user_level(self, user_id: int, level: int):
+        """Set a user's permission level."""
+        with self._transaction() as cursor:
+            cursor.execute("UPDATE users SET user_level = ? WHERE user_id = ?", (level, user_id))
 
     def increment_message_count(self, user_id: int):
         """Increment user's message count."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self._transaction() as cursor:
             cursor.execute("""
                 UPDATE users SET message_count = message_count + 1 WHERE user_id = ?
             """, (user_id,))
-            conn.commit()
 
-    def save_chat(self, user_id: int, message: str, response: str):
-        """Save chat exchange to history."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO chat_history (user_id, message, response)
-                VALUES (?, ?, ?)
-            """, (user_id, message, response))
-            conn.commit()
+    def _insert_chats(self, cursor: sqlite3.Cursor, chats: List[tuple]):
+        """Encode and insert (user_id, message, response, timestamp, canned) rows."""
+        rows = []
+        for user_id, message, response, timestamp, canned in chats:
+            stored_response, response_id = self.codec.encode_response(response, cursor, canned)
+            rows.append((user_id, self.codec.encode_text(message), stored_response, response_id, timestamp))
+        cursor.executemany("""
+            INSERT INTO chat_history (user_id, message, response, response_id, timestamp)
+            VALUES (?, ?, ?, ?, ?)
+        """, rows)
+
+    @contextmanager
+    def _chat_transaction(self):
+        """Transaction that may add canned responses to the codec dictionary."""
+        try:
+            with self._transaction() as cursor:
+                yield cursor
+        except BaseException:
+            self.codec.rollback()
+            raise
+        self.codec.commit()
+
+    def save_chat(self, user_id: int, message: str, response: str, canned: bool = False):
+        """Save chat exchange to history.
+
+        canned marks a fixed rule-based response, stored once in the
+        responses dictionary and referenced by id.
+        """
+        with self._chat_transaction() as cursor:
+            self._insert_chats(cursor, [(user_id, message, response, int(time.time()), canned)])
+
+    _TOUCH_USER_SQL = """
+        INSERT INTO users (user_id, username, first_name, last_name, message_count, last_seen)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            username = excluded.username,
+            first_name = excluded.first_name,
+            last_name = excluded.last_name,
+            message_count = message_count + excluded.message_count,
+            last_seen = excluded.last_seen
+        RETURNING *
+    """
+
+    def apply_write_batch(self, users: List[tuple], increments: List[tuple], chats: List[tuple]) -> List[Dict]:
+        """Apply buffered touches, count increments and chat rows in one transaction.
+
+        users holds (user_id, username, first_name, last_name, messages, last_seen),
+        increments holds (amount, user_id) for users without a buffered
+        profile and chats holds (user_id, message, response, timestamp, canned).
+        Returns the updated users rows.
+        """
+        rows = []
+        with self._chat_transaction() as cursor:
+            for params in users:
+                cursor.execute(self._TOUCH_USER_SQL, params)
+                rows.append(dict(cursor.fetchone()))
+            for params in increments:
+                cursor.execute("""
+                    UPDATE users SET message_count = message_count + ? WHERE user_id = ?
+                    RETURNING *
+                """, params)
+                rows.extend(dict(row) for row in cursor.fetchall())
+            self._insert_chats(cursor, chats)
+        return rows
 
     def get_chat_history(self, user_id: int, limit: int = 10) -> List[Dict]:
         """Get recent chat history for user."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
+        with self._cursor() as cursor:
             cursor.execute("""
-                SELECT message, response, timestamp
-                FROM chat_history
-                WHERE user_id = ?
-                ORDER BY timestamp DESC
+                SELECT c.message, COALESCE(r.text, c.response) AS response, c.timestamp
+                FROM chat_history c
+                LEFT JOIN responses r ON r.id = c.response_id
+                WHERE c.user_id = ?
+                ORDER BY c.timestamp DESC, c.id DESC
                 LIMIT ?
             """, (user_id, limit))
-            return [dict(row) for row in cursor.fetchall()]
+            decode = self.codec.decode_text
+            return [
+                {"message": decode(message), "response": decode(response), "timestamp": timestamp}
+                for message, response, timestamp in cursor.fetchall()
+            ]
+
+    def get_counter(self, name: str) -> int:
+        """Read one of the maintained COUNTERS."""
+        with self._cursor() as cursor:
+            cursor.execute("SELECT value FROM counters WHERE name = ?", (name,))
+            row = cursor.fetchone()
+            return row[0] if row else 0
+
+    def _rebuild_counters(self, cursor) -> Dict[str, tuple]:
+        """Recompute every counter inside the caller's transaction."""
+        cursor.execute("SELECT name, value FROM counters")
+        stored = {row[0]: row[1] for row in cursor.fetchall()}
+        changes = {}
+        for name, query in COUNTERS.items():
+            cursor.execute(query)
+            actual = cursor.fetchone()[0]
+            cursor.execute("""
+                INSERT INTO counters (name, value) VALUES (?, ?)
+                ON CONFLICT(name) DO UPDATE SET value = excluded.value
+            """, (name, actual))
+            changes[name] = (stored.get(name), actual)
+        return changes
+
+    def rebuild_counters(self) -> Dict[str, tuple]:
+        """Recompute the counters from scratch and return {name: (stored, actual)}."""
+        with self._transaction() as cursor:
+            return self._rebuild_counters(cursor)
 
     def get_total_users(self) -> int:
         """Get total number of users."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM users")
-            return cursor.fetchone()[0]
+        return self.get_counter("total_users")
 
     def get_total_messages(self) -> int:
         """Get total number of messages."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT SUM(message_count) FROM users")
-            result = cursor.fetchone()[0]
-            return result if result else 0
\ No newline at end of file
+        return self.get_counter("total_messages")
+
+    def count_active_users(self, since: datetime) -> int:
+        """Count users seen after the given time."""
+        with self._cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM users WHERE last_seen > ?", (since,))
+            return cursor.fetchone()[0]
+
+    def count_blocked_users(self) -> int:
+        """Count blocked users."""
+        return self.get_counter("blocked_users")
+
+    def get_top_users(self, limit: int = 5) -> List[Dict]:
+        """Get the users with the most messages."""
+        with self._cursor() as cursor:
+            cursor.execute("""
+                SELECT first_name, username, message_count
+                FROM users
+                ORDER BY message_count DESC
+                LIMIT ?
+            """, (limit,))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def get_unblocked_user_ids(self) -> List[int]:
+        """Get ids of every user that is not blocked."""
+        with self._cursor() as cursor:
+            cursor.execute("SELECT user_id FROM users WHERE is_blocked = 0")
+            return [row[0] for row in cursor.fetchall()]
+
+    def get_setting(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        """Read a value from the settings table."""
+        with self._cursor() as cursor:
+            cursor.execute("SELECT value FROM settings WHERE key = ?", (key,))
+            row = cursor.fetchone()
+            return row[0] if row else default
+
+    def set_setting(self, key: str, value: str):
+        """Write a value to the settings table."""
+        with self._transaction() as cursor:
+            cursor.execute("""
+                INSERT INTO settings (key, value) VALUES (?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value
+            """, (key, value))
+
+    def get_max_chat_id(self) -> int:
+        """Get the id of the newest chat_history row."""
+        with self._cursor() as cursor:
+            cursor.execute("SELECT MAX(id) FROM chat_history")
+            return cursor.fetchone()[0] or 0
+
+    def get_users_with_chats_since(self, chat_id: int) -> List[int]:
+        """Get users that have chat_history rows newer than chat_id."""
+        with self._cursor() as cursor:
+            cursor.execute("SELECT DISTINCT user_id FROM chat_history WHERE id > ?", (chat_id,))
+            return [row[0] for row in cursor.fetchall()]
+
+    def get_excess_chat_ids(self, user_id: int, keep: int, limit: int) -> List[int]:
+        """Get ids of a user's chat rows beyond the newest `keep` exchanges."""
+        with self._cursor() as cursor:
+            cursor.execute("""
+                SELECT id FROM chat_history
+                WHERE user_id = ?
+                ORDER BY timestamp DESC, id DESC
+                LIMIT ? OFFSET ?
+            """, (user_id, limit, keep))
+            return [row[0] for row in cursor.fetchall()]
+
+    def get_expired_chat_ids(self, before: int, limit: int) -> List[int]:
+        """Get ids of the oldest chat rows with an epoch timestamp before `before`.
+
+        Rows are walked in id (insertion) order and the walk stops at the
+        first row that is still fresh, so the cost is bounded by `limit`.
+        """
+        with self._cursor() as cursor:
+            cursor.execute("SELECT id, timestamp FROM chat_history ORDER BY id LIMIT ?", (limit,))
+            expired = []
+            for chat_id, timestamp in cursor.fetchall():
+                if timestamp is not None and timestamp >= before:
+                    break
+                expired.append(chat_id)
+            return expired
+
+    def archive_chats(self, chat_ids: List[int]) -> int:
+        """Move chat rows to the compressed archive (or just delete them if none is attached)."""
+        if not chat_ids:
+            return 0
+        placeholders = ",".join("?" * len(chat_ids))
+        with self._transaction() as cursor:
+            if self.archive_path:
+                cursor.execute(f"""
+                    SELECT c.id, c.user_id, c.message, COALESCE(r.text, c.response), c.timestamp
+                    FROM chat_history c
+                    LEFT JOIN responses r ON r.id = c.response_id
+                    WHERE c.id IN ({placeholders}) ORDER BY c.id
+                """, chat_ids)
+                decode = self.codec.decode_text
+                rows = [
+                    [chat_id, user_id, decode(message), decode(response), timestamp]
+                    for chat_id, user_id, message, response, timestamp in cursor.fetchall()
+                ]
+                if rows:
+                    payload = zlib.compress(json.dumps(rows, ensure_ascii=False).encode("utf-8"), 6)
+                    cursor.execute("""
+                        INSERT INTO archive.chat_history_archive
+                            (first_chat_id, last_chat_id, row_count, payload)
+                        VALUES (?, ?, ?, ?)
+                    """, (rows[0][0], rows[-1][0], len(rows), payload))
+            cursor.execute(f"DELETE FROM chat_history WHERE id IN ({placeholders})", chat_ids)
+            return cursor.rowcount
+
+    def incremental_vacuum_enabled(self) -> bool:
+        """Whether the file uses incremental auto-vacuum."""
+        with self._lock:
+            return self._connect().execute("PRAGMA main.auto_vacuum").fetchone()[0] == 2
+
+    def enable_incremental_vacuum(self) -> bool:
+        """Switch an existing database to incremental auto-vacuum.
+
+        This rebuilds the whole file with VACUUM, holding the connection
+        for as long as that takes, so it is only done offline by
+        scripts.migrate_chat_history --incremental-vacuum.
+        """
+        with self._lock:
+            conn = self._connect()
+            if conn.execute("PRAGMA main.auto_vacuum").fetchone()[0] == 2:
+                return False
+            conn.execute("PRAGMA main.auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM main")
+            return True
+
+    def incremental_vacuum(self, pages: int) -> int:
+        """Release up to `pages` free pages to the OS and return how many are left."""
+        with self._lock:
+            conn = self._connect()
+            conn.execute(f"PRAGMA main.incremental_vacuum({int(pages)})").fetchall()
+            return conn.execute("PRAGMA main.freelist_count").fetchone()[0]
+
+    def iter_users(self, chunk_size: int = 5000) -> Iterator[List[Dict]]:
+        """Yield every users row in user_id order, chunk_size rows at a time.
+
+        Each chunk is a separate keyset query, so the lock is released
+        between chunks and memory use does not depend on table size.
+        """
+        last_id = -2 ** 63
+        while True:
+            with self._cursor() as cursor:
+                cursor.execute("SELECT * FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                               (last_id, chunk_size))
+                rows = [dict(row) for row in cursor.fetchall()]
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1]["user_id"]
+
+    def iter_chat_history(self, chunk_size: int = 5000) -> Iterator[List[Dict]]:
+        """Yield every decoded chat_history row in id order, chunk_size rows at a time."""
+        decode = self.codec.decode_text
+        last_id = 0
+        while True:
+            with self._cursor() as cursor:
+                cursor.execute("""
+                    SELECT c.id, c.user_id, c.message, COALESCE(r.text, c.response), c.timestamp
+                    FROM chat_history c
+                    LEFT JOIN responses r ON r.id = c.response_id
+                    WHERE c.id > ? ORDER BY c.id LIMIT ?
+                """, (last_id, chunk_size))
+                rows = [
+                    {"id": chat_id, "user_id": user_id, "message": decode(message),
+                     "response": decode(response), "timestamp": timestamp}
+                    for chat_id, user_id, message, response, timestamp in cursor.fetchall()
+                ]
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1]["id"]
+
+    def get_responses(self) -> List[str]:
+        """Get the texts in the canned responses dictionary."""
+        with self._cursor() as cursor:
+            cursor.execute("SELECT text FROM responses ORDER BY id")
+            return [row[0] for row in cursor.fetchall()]
+
+    def register_responses(self, texts: List[str]) -> int:
+        """Add canned responses to the dictionary and return its size."""
+        with self._chat_transaction() as cursor:
+            return self.codec.register(cursor, texts)
+
+    def import_users(self, users: List[Dict]) -> int:
+        """Insert or overwrite users rows in one transaction."""
+        with self._transaction() as cursor:
+            cursor.executemany("""
+                INSERT INTO users (user_id, username, first_name, last_name, is_blocked,
+                                   user_level, message_count, first_seen, last_seen)
+                VALUES (:user_id, :username, :first_name, :last_name, :is_blocked,
+                        :user_level, :message_count, COALESCE(:first_seen, CURRENT_TIMESTAMP),
+                        COALESCE(:last_seen, CURRENT_TIMESTAMP))
+                ON CONFLICT(user_id) DO UPDATE SET
+                    username = excluded.username,
+                    first_name = excluded.first_name,
+                    last_name = excluded.last_name,
+                    is_blocked = excluded.is_blocked,
+                    user_level = excluded.user_level,
+                    message_count = excluded.message_count,
+                    first_seen = excluded.first_seen,
+                    last_seen = excluded.last_seen
+            """, [{**USER_DEFAULTS, **user} for user in users])
+            return len(users)
+
+    def import_chats(self, chats: List[Dict]) -> int:
+        """Insert chat rows in one transaction, skipping ids that already exist.
+
+        Rows without an id get a new one. timestamp may be epoch seconds
+        or a 'YYYY-MM-DD HH:MM:SS' UTC string.
+        """
+        rows = []
+        for chat in chats:
+            stored_response, response_id = self.codec.encode_response(chat.get("response"))
+            rows.append((chat.get("id"), chat.get("user_id"), self.codec.encode_text(chat.get("message")),
+                         stored_response, response_id, to_epoch(chat.get("timestamp"))))
+        with self._transaction() as cursor:
+            cursor.executemany("""
+                INSERT INTO chat_history (id, user_id, message, response, response_id, timestamp)
+                VALUES (?, ?, ?, ?, ?, COALESCE(?, CAST(strftime('%s', 'now') AS INTEGER)))
+                ON CONFLICT(id) DO NOTHING
+            """, rows)
+            return cursor.rowcount
+
+
+# Columns filled in when an imported user record leaves them out
+USER_DEFAULTS = {
+    "username": None,
+    "first_name": None,
+    "last_name": None,
+    "is_blocked": 0,
+    "user_level": 0,
+    "message_count": 0,
+    "first_seen": None,
+    "last_seen": None,
+}
+
+
+def to_epoch(timestamp: Union[int, float, str, None]) -> Optional[int]:
+    """Convert an epoch number or a UTC 'YYYY-MM-DD HH:MM:SS' string to epoch seconds."""
+    if timestamp is None or isinstance(timestamp, (int, float)):
+        return None if timestamp is None else int(timestamp)
+    return int(datetime.fromisoformat(timestamp).replace(tzinfo=timezone.utc).timestamp())
+
+
+def is_legacy_chat_history(conn: sqlite3.Connection) -> bool:
+    """True if chat_history exists in the original inline-text format."""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(chat_history)").fetchall()]
+    return bool(columns) and "response_id" not in columns
+
+
+def migrate_chat_history(conn: sqlite3.Connection, codec: ChatCodec, min_repeats: int = 3,
+                         chunk_size: int = 10_000, progress=None) -> int:
+    """Rewrite a legacy chat_history table in the compact format, in one transaction.
+
+    Responses stored at least min_repeats times go into the responses
+    dictionary, long text is compressed and TEXT timestamps become epoch
+    seconds. Rows are copied in chunks of chunk_size so memory stays flat;
+    progress, if given, is called with the number of rows copied so far.
+    Returns the number of rows migrated.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = conn.cursor()
+        cursor.execute(RESPONSES_SCHEMA)
+        cursor.execute("""
+            SELECT response FROM chat_history
+            WHERE response IS NOT NULL
+            GROUP BY response HAVING COUNT(*) >= ?
+        """, (min_repeats,))
+        frequent = [row[0] for row in cursor.fetchall()]
+        codec.register(cursor, frequent)
+
+        cursor.execute("DROP INDEX IF EXISTS idx_chat_history_user_time")
+        cursor.execute("ALTER TABLE chat_history RENAME TO chat_history_legacy")
+        cursor.execute(CHAT_HISTORY_SCHEMA)
+
+        migrated = 0
+        last_id = 0
+        while True:
+            cursor.execute("""
+                SELECT id, user_id, message, response, CAST(strftime('%s', timestamp) AS INTEGER)
+                FROM chat_history_legacy
+                WHERE id > ? ORDER BY id LIMIT ?
+            """, (last_id, chunk_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            encoded = []
+            for chat_id, user_id, message, response, timestamp in rows:
+                stored_response, response_id = codec.encode_response(response)
+                encoded.append((chat_id, user_id, codec.encode_text(message), stored_response, response_id, timestamp))
+            cursor.executemany("""
+                INSERT INTO chat_history (id, user_id, message, response, response_id, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, encoded)
+            last_id = rows[-1][0]
+            migrated += len(rows)
+            if progress:
+                progress(migrated)
+
+        cursor.execute("DROP TABLE chat_history_legacy")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        codec.rollback()
+        raise
+    # Dictionary ids are only trusted once their rows are committed
+    codec.commit()
+    return migrated
@@ -0,0 +1,104 @@
+"""
+Bounded in-memory ring buffers of each user's recent chat exchanges
+"""
+
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+from config import HISTORY_CACHE_TURNS, HISTORY_CACHE_MB, HISTORY_CACHE_TTL
+
+# Rough bytes per cached exchange on top of its text (dict, strings, deque slot)
+EXCHANGE_OVERHEAD = 400
+
+
+def _exchange_size(exchange: Dict) -> int:
+    return len(exchange["message"]) + len(exchange["response"]) + EXCHANGE_OVERHEAD
+
+
+class _History:
+    __slots__ = ("loaded_at", "exchanges", "size")
+
+    def __init__(self, exchanges: deque):
+        self.loaded_at = time.monotonic()
+        self.exchanges = exchanges
+        self.size = sum(_exchange_size(exchange) for exchange in exchanges)
+
+
+class HistoryCache:
+    """The last `turns` exchanges per user, so prompts are built without reading SQLite.
+
+    A user's buffer is filled from the database on first use and then
+    kept current by append() as exchanges are saved. Users are evicted
+    least recently used first once the buffers' estimated size passes
+    max_bytes, and re-read after ttl seconds so rows archived or written
+    outside the bot are picked up eventually.
+    """
+
+    def __init__(self, turns: int = HISTORY_CACHE_TURNS, max_bytes: int = int(HISTORY_CACHE_MB * 1024 * 1024),
+                 ttl: float = HISTORY_CACHE_TTL):
+        self.turns = turns
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, _History]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, user_id: int, limit: int) -> Optional[List[Dict]]:
+        """Return up to `limit` exchanges, newest first, or None if they have to be read."""
+        entry = self._entries.get(user_id)
+        if entry is None or limit > self.turns or time.monotonic() - entry.loaded_at > self.ttl:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        exchanges = entry.exchanges
+        return [exchanges[i] for i in range(len(exchanges) - 1, max(len(exchanges) - limit, 0) - 1, -1)]
+
+    def put(self, user_id: int, history: List[Dict]):
+        """Store history read from the database (newest first, at least `turns` rows if they exist)."""
+        if self.turns <= 0:
+            return
+        self.invalidate(user_id)
+        entry = self._entries[user_id] = _History(deque(reversed(history[:self.turns]), maxlen=self.turns))
+        self.size += entry.size
+        self._evict()
+
+    def append(self, user_id: int, message: str, response: str, timestamp):
+        """Add a new exchange to a user's buffer, if the user is cached."""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return
+        exchange = {"message": message, "response": response, "timestamp": timestamp}
+        if len(entry.exchanges) == entry.exchanges.maxlen:
+            dropped = _exchange_size(entry.exchanges[0])
+            entry.size -= dropped
+            self.size -= dropped
+        entry.exchanges.append(exchange)
+        entry.size += _exchange_size(exchange)
+        self.size += _exchange_size(exchange)
+        self._entries.move_to_end(user_id)
+        self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self.size -= entry.size
+
+    def invalidate(self, user_id: int):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
@@ -0,0 +1,136 @@
+"""
+Background chat history retention: archive old rows in batches and vacuum incrementally
+"""
+
+import asyncio
+import time
+from typing import Optional, Dict
+import logging
+
+from config import (HISTORY_KEEP_PER_USER, HISTORY_MAX_AGE_DAYS, HISTORY_ARCHIVE_PATH,
+                    RETENTION_INTERVAL, RETENTION_BATCH_SIZE, RETENTION_VACUUM_PAGES)
+
+logger = logging.getLogger(__name__)
+
+# settings key holding the newest chat id already checked for per-user trimming
+LAST_CHECKED_KEY = "retention_last_chat_id"
+
+
+class RetentionJob:
+    """Keep chat_history bounded by moving old rows to the archive.
+
+    Rows older than max_age_days and rows beyond the newest keep_per_user
+    exchanges of a user are moved in transactions of at most batch_size
+    rows, each one a separate call on the database thread so handlers
+    keep running in between. Only users with new rows since the last run
+    are re-checked. Freed pages are handed back with incremental vacuum,
+    on databases that use it: older files have to be converted offline
+    with scripts.migrate_chat_history --incremental-vacuum first.
+    """
+
+    def __init__(self, database, keep_per_user: int = HISTORY_KEEP_PER_USER,
+                 max_age_days: int = HISTORY_MAX_AGE_DAYS, archive_path: str = HISTORY_ARCHIVE_PATH,
+                 interval: int = RETENTION_INTERVAL, batch_size: int = RETENTION_BATCH_SIZE,
+                 vacuum_pages: int = RETENTION_VACUUM_PAGES):
+        self._database = database
+        self.keep_per_user = keep_per_user
+        self.max_age_days = max_age_days
+        self.archive_path = archive_path
+        self.interval = interval
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+
+        self._task: Optional[asyncio.Task] = None
+        self._stop_event = asyncio.Event()
+        self._prepared = False
+        self._vacuum = False
+
+        self.archived_rows = 0
+        self.failed_runs = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.keep_per_user > 0 or self.max_age_days > 0
+
+    async def _prepare(self):
+        """Attach the archive and check for incremental vacuum once."""
+        if self._prepared:
+            return
+        if self.archive_path:
+            await self._database.attach_archive(self.archive_path)
+        self._vacuum = await self._database.incremental_vacuum_enabled()
+        if not self._vacuum:
+            logger.warning("Database does not use incremental auto-vacuum, so archived rows will not shrink it; "
+                           "stop the bot and run scripts.migrate_chat_history --incremental-vacuum to convert it")
+        self._prepared = True
+
+    async def run_once(self) -> Dict[str, int]:
+        """Apply the retention policy once and return how many rows were moved."""
+        await self._prepare()
+        stats = {"expired": 0, "trimmed": 0, "free_pages": 0}
+
+        if self.max_age_days > 0:
+            cutoff = int(time.time()) - self.max_age_days * 86400
+            while not self._stop_event.is_set():
+                chat_ids = await self._database.get_expired_chat_ids(cutoff, self.batch_size)
+                if not chat_ids:
+                    break
+                stats["expired"] += await self._database.archive_chats(chat_ids)
+
+        if self.keep_per_user > 0:
+            last_checked = int(await self._database.get_setting(LAST_CHECKED_KEY, "0"))
+            newest = await self._database.get_max_chat_id()
+            for user_id in await self._database.get_users_with_chats_since(last_checked):
+                while not self._stop_event.is_set():
+                    chat_ids = await self._database.get_excess_chat_ids(user_id, self.keep_per_user, self.batch_size)
+                    if not chat_ids:
+                        break
+                    stats["trimmed"] += await self._database.archive_chats(chat_ids)
+                if self._stop_event.is_set():
+                    break
+            else:
+                await self._database.set_setting(LAST_CHECKED_KEY, str(newest))
+
+        # One bounded vacuum step per call; stop if a step frees nothing
+        if self._vacuum:
+            free_pages = await self._database.incremental_vacuum(self.vacuum_pages)
+            while free_pages and not self._stop_event.is_set():
+                remaining = await self._database.incremental_vacuum(self.vacuum_pages)
+                if remaining >= free_pages:
+                    break
+                free_pages = remaining
+            stats["free_pages"] = free_pages
+
+        self.archived_rows += stats["expired"] + stats["trimmed"]
+        if stats["expired"] or stats["trimmed"]:
+            logger.info(f"Retention archived {stats['expired']} expired and {stats['trimmed']} excess chat rows")
+        return stats
+
+    def start(self):
+        """Start the periodic retention task."""
+        if self._task is None and self.enabled:
+            self._stop_event.clear()
+            self._task = asyncio.create_task(self._retention_loop())
+            logger.info(f"Retention started (keep={self.keep_per_user}, max_age_days={self.max_age_days})")
+            if not self.archive_path:
+                logger.warning("HISTORY_ARCHIVE_PATH is empty: chat history past the retention limits "
+                               "will be deleted, not archived")
+
+    async def stop(self):
+        """Stop the retention task after the current batch."""
+        if self._task is not None:
+            self._stop_event.set()
+            await self._task
+            self._task = None
+
+    async def _retention_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.failed_runs += 1
+                logger.error(f"Retention run failed: {e}")
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
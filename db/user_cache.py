@@ -0,0 +1,68 @@
+"""
+Bounded LRU/TTL cache of user rows
+"""
+
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Tuple
+
+from config import USER_CACHE_SIZE, USER_CACHE_TTL
+
+
+class UserCache:
+    """Cache users rows by user_id, evicting the least recently used past max_size.
+
+    A cached None records that the user does not exist yet. Entries older
+    than ttl seconds are re-read so writes made outside the bot (scripts,
+    manual SQL) are picked up eventually.
+    """
+
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Tuple[float, Optional[Dict]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, user_id: int) -> Tuple[bool, Optional[Dict]]:
+        """Return (found, row) for a user."""
+        entry = self._entries.get(user_id)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return True, entry[1]
+
+    def put(self, user_id: int, user: Optional[Dict]):
+        """Store the row read from the database."""
+        self._entries[user_id] = (time.monotonic(), user)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def update(self, user_id: int, **fields):
+        """Apply a committed column change to a cached row."""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return
+        if entry[1] is None:
+            # The write may have created the row; read it back next time
+            self.invalidate(user_id)
+        else:
+            entry[1].update(fields)
+
+    def invalidate(self, user_id: int):
+        """Drop a user so the next read goes to the database."""
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,286 @@
+"""
+Write-behind buffering for per-message database writes
+"""
+
+import asyncio
+import sqlite3
+import time
+from datetime import datetime, timezone
+from typing import Optional, List, Dict
+import logging
+
+from config import WRITE_BEHIND_INTERVAL, WRITE_BEHIND_BATCH_ROWS, WRITE_BEHIND_MAX_PENDING, WRITE_BEHIND_MAX_RETRIES
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindFull(Exception):
+    """Buffered rows stayed above max_pending because flushes kept failing."""
+
+
+def _utc_timestamp() -> str:
+    """Return the current time in SQLite's CURRENT_TIMESTAMP format."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class WriteBehindQueue:
+    """Buffer each turn's user upsert, message count increment and exchange, and commit them in batches.
+
+    Repeated upserts for one user collapse into the latest profile and
+    count increments are summed into it, so a flush costs one transaction
+    (one upsert statement per user) no matter how many messages
+    arrived since the last one. Rows are flushed
+    every flush_interval seconds, as soon as batch_rows are pending, and
+    on stop(). Writers wait for a flush once max_pending rows are buffered.
+
+    A failed batch is put back, its error is raised to whoever asked for
+    the flush (settle() on the background queue counts it), and it is
+    retried with the next flush. After
+    max_retries failures in a row its rows are tried one transaction
+    each: rows SQLite rejects (a constraint, a bad value) are logged and
+    dropped so they cannot block the rest, while an OperationalError
+    (disk full, locked) leaves the remaining rows buffered for later.
+    """
+
+    def __init__(self, database, flush_interval: float = WRITE_BEHIND_INTERVAL,
+                 batch_rows: int = WRITE_BEHIND_BATCH_ROWS, max_pending: int = WRITE_BEHIND_MAX_PENDING,
+                 max_retries: int = WRITE_BEHIND_MAX_RETRIES):
+        self._database = database
+        self.flush_interval = flush_interval
+        self.batch_rows = batch_rows
+        self.max_pending = max_pending
+        self.max_retries = max(max_retries, 1)
+
+        self._users: Dict[int, Dict] = {}
+        self._increments: Dict[int, int] = {}
+        self._chats: List[tuple] = []
+        # Batch currently being committed, still visible to readers
+        self._inflight: Optional[tuple] = None
+
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.flushed_batches = 0
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+        self.dropped_rows = 0
+        # Failed flushes since the last one that committed
+        self._failures = 0
+
+    @property
+    def pending_rows(self) -> int:
+        """Number of buffered rows not yet handed to SQLite."""
+        return len(self._users) + len(self._increments) + len(self._chats)
+
+    def record_turn(self, user_id: int, username: str, first_name: str, last_name: Optional[str], message: str,
+                    response: Optional[str], canned: bool = False):
+        """Buffer a user upsert, a count increment and (if answered) the exchange, without waiting.
+
+        Readers see them at once, in the order turns call this; settle()
+        should follow (it may wait for a flush) but can run later.
+        """
+        self._buffer_user(user_id, username, first_name, last_name)
+        self._increments[user_id] = self._increments.get(user_id, 0) + 1
+        if response is not None:
+            self._buffer_chat(user_id, message, response, canned)
+
+    def _buffer_user(self, user_id: int, username: str, first_name: str, last_name: Optional[str]):
+        self._users[user_id] = {
+            "username": username,
+            "first_name": first_name,
+            "last_name": last_name,
+            "last_seen": datetime.now(),
+        }
+
+    def _buffer_chat(self, user_id: int, message: str, response: str, canned: bool):
+        timestamp = int(time.time())
+        self._chats.append((user_id, message, response, timestamp, canned))
+        self._database.history_cache.append(user_id, message, response, timestamp)
+
+    async def settle(self):
+        """Apply backpressure and early flushes after rows are buffered.
+
+        Flushes once batch_rows are pending, raising its error if it
+        fails. At max_pending the caller waits for flushes until the
+        buffer is below it again, and WriteBehindFull is raised if
+        max_retries flushes in a row fail to get it there.
+        """
+        pending = self.pending_rows
+        if pending >= self.max_pending:
+            error = None
+            for attempt in range(self.max_retries):
+                if attempt:
+                    await asyncio.sleep(self.flush_interval)
+                try:
+                    await self.flush()
+                    return
+                except Exception as e:
+                    error = e
+                    if self.pending_rows < self.max_pending:
+                        raise
+            raise WriteBehindFull(f"{self.pending_rows} rows still buffered after {self.max_retries} flushes") from error
+        elif pending >= self.batch_rows:
+            await self.flush()
+
+    async def flush(self):
+        """Commit every buffered row in a single transaction; raise its error if it failed."""
+        async with self._flush_lock:
+            if not self.pending_rows:
+                return
+
+            users, increments, chats = self._users, self._increments, self._chats
+            self._users, self._increments, self._chats = {}, {}, []
+            self._inflight = (users, increments, chats)
+            row_count = len(users) + len(increments) + len(chats)
+
+            try:
+                await self._apply(users, increments, chats)
+            except Exception as e:
+                self.failed_flushes += 1
+                self._failures += 1
+                logger.error(f"Write-behind flush of {row_count} rows failed: {e}")
+                if self._failures >= self.max_retries:
+                    users, increments, chats = await self._apply_rows(users, increments, chats)
+                self._requeue(users, increments, chats)
+                raise
+            else:
+                self.flushed_batches += 1
+                self.flushed_rows += row_count
+                self._failures = 0
+            finally:
+                self._inflight = None
+
+    async def _apply(self, users: Dict[int, Dict], increments: Dict[int, int], chats: List[tuple]):
+        await self._database.apply_write_batch(
+            [(user_id, u["username"], u["first_name"], u["last_name"],
+              increments.get(user_id, 0), u["last_seen"])
+             for user_id, u in users.items()],
+            [(amount, user_id) for user_id, amount in increments.items() if user_id not in users],
+            chats,
+        )
+
+    async def _apply_rows(self, users: Dict[int, Dict], increments: Dict[int, int], chats: List[tuple]):
+        """Apply a failing batch one row per transaction and return the rows left to retry."""
+        rows = [({user_id: profile}, {user_id: increments.get(user_id, 0)}, [])
+                for user_id, profile in users.items()]
+        rows += [({}, {user_id: amount}, []) for user_id, amount in increments.items() if user_id not in users]
+        rows += [({}, {}, [chat]) for chat in chats]
+
+        committed = 0
+        for index, row in enumerate(rows):
+            try:
+                await self._apply(*row)
+                committed += 1
+            except sqlite3.OperationalError as e:
+                # The database itself is failing, not this row; keep the rest for later
+                logger.error(f"Write-behind row retry stopped after {committed} rows: {e}")
+                left_users, left_increments, left_chats = {}, {}, []
+                for row_users, row_increments, row_chats in rows[index:]:
+                    left_users.update(row_users)
+                    left_increments.update((user_id, amount) for user_id, amount in row_increments.items() if amount)
+                    left_chats.extend(row_chats)
+                self._count_committed(committed)
+                return left_users, left_increments, left_chats
+            except Exception as e:
+                self.dropped_rows += 1
+                logger.error(f"Write-behind dropped a row SQLite keeps rejecting: {row!r:.300} ({e!r})")
+        self._count_committed(committed)
+        return {}, {}, []
+
+    def _count_committed(self, rows: int):
+        if rows:
+            self.flushed_batches += 1
+            self.flushed_rows += rows
+            self._failures = 0
+
+    def _requeue(self, users: Dict[int, Dict], increments: Dict[int, int], chats: List[tuple]):
+        """Put a failed batch back in front of rows buffered since."""
+        users.update(self._users)
+        self._users = users
+        for user_id, amount in self._increments.items():
+            increments[user_id] = increments.get(user_id, 0) + amount
+        self._increments = increments
+        self._chats = chats + self._chats
+
+    def start(self):
+        """Start the periodic flush task."""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._flush_loop())
+            logger.info(f"Write-behind started (interval={self.flush_interval}s, max_pending={self.max_pending})")
+
+    async def stop(self):
+        """Stop the flush task and commit anything still buffered."""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.error(f"Write-behind stopped with {self.pending_rows} rows not saved")
+
+    async def _flush_loop(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                pass  # logged by flush(), retried next time
+
+    def _batches(self) -> List[tuple]:
+        """Buffered batches from oldest to newest."""
+        batches = [self._inflight] if self._inflight else []
+        batches.append((self._users, self._increments, self._chats))
+        return batches
+
+    def overlay_user(self, user_id: int, user: Optional[Dict]) -> Optional[Dict]:
+        """Apply buffered writes for a user on top of the row read from SQLite."""
+        profile = None
+        extra_messages = 0
+        for users, increments, _ in self._batches():
+            profile = users.get(user_id, profile)
+            extra_messages += increments.get(user_id, 0)
+
+        if profile is None and not extra_messages:
+            return user
+
+        if user is None:
+            if profile is None:
+                return None
+            now = _utc_timestamp()
+            user = {
+                "user_id": user_id,
+                "is_blocked": 0,
+                "user_level": 0,
+                "message_count": 0,
+                "first_seen": now,
+                "last_seen": now,
+            }
+        else:
+            user = dict(user)
+
+        if profile is not None:
+            user.update(profile)
+        user["message_count"] = (user.get("message_count") or 0) + extra_messages
+        return user
+
+    def overlay_history(self, user_id: int, history: List[Dict], limit: int) -> List[Dict]:
+        """Prepend buffered exchanges for a user to history read from SQLite."""
+        pending = [
+            {"message": message, "response": response, "timestamp": timestamp}
+            for _, _, chats in self._batches()
+            for chat_user_id, message, response, timestamp, _ in chats
+            if chat_user_id == user_id
+        ]
+        if not pending:
+            return history
+        pending.reverse()
+        return (pending + history)[:limit]
@@ -2,8 +2,12 @@ import asyncio
 import logging
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters
-from config import BOT_TOKEN, LOG_LEVEL
+from config import BOT_TOKEN, LOG_LEVEL, DATABASE_PATH
+from db import get_async_database
 from plugins import start, chat, help_command, stats
+from utils.background import background
+from utils.debounce import debouncer
+from utils.http_clients import http_clients
 from utils.logger_chat import setup_logging
 
 logger = logging.getLogger(__name__)
@@ -13,7 +17,14 @@ def main():
     setup_logging(LOG_LEVEL)
     logger.info("Starting Miku Nakano Bot...")
 
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .post_init(on_startup)
+        .post_stop(on_stop)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
     application.add_handler(CommandHandler("start", start.start_command))
     application.add_handler(CommandHandler("help", help_command.help_command))
     application.add_handler(CommandHandler("stats", stats.stats_command))
@@ -33,6 +44,23 @@ def main():
     logger.info("Bot started successfully! Press Ctrl+C to stop.")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
+async def on_startup(application: Application):
+    db = get_async_database(DATABASE_PATH)
+    db.write_behind.start()
+    db.retention.start()
+    http_clients.start()
+    background.start()
+
+async def on_stop(application: Application):
+    # Answer merged message bursts while the bot can still send replies
+    await debouncer.flush()
+
+async def on_shutdown(application: Application):
+    # Turns recorded after their reply go to the database before it closes
+    await background.stop()
+    await http_clients.close()
+    await get_async_database(DATABASE_PATH).close()
+
 async def error_handler(update: Update, context):
     logger.error(f"Exception while handling an update: {context.error}")
  
@@ -1,50 +1,57 @@
 from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler
-from db.database import Database
+from db import get_async_database
 from config import DATABASE_PATH
 from utils.admin import admin_only
+from utils.http_clients import http_clients
+from utils.background import background
+from utils.debounce import debouncer
+from utils.prompt import prompt_builder
+from utils.providers import providers
+from utils.scheduler import scheduler
+from utils.streaming import stream_stats
+from utils.persona import reload_persona
 import logging
 import asyncio
+from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
-db = Database(DATABASE_PATH)
+db = get_async_database(DATABASE_PATH)
 
 @admin_only
 async def stats_admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show detailed bot statistics (Admin only)."""
-    total_users = db.get_total_users()
-    total_messages = db.get_total_messages()
-
-    import sqlite3
-    from datetime import datetime, timedelta
-
-    with sqlite3.connect(DATABASE_PATH) as conn:
-        cursor = conn.cursor()
-
-        yesterday = datetime.now() - timedelta(days=1)
-        cursor.execute("""
-            SELECT COUNT(*) FROM users 
-            WHERE last_seen > ?
-        """, (yesterday,))
-        active_24h = cursor.fetchone()[0]
-
-        week_ago = datetime.now() - timedelta(days=7)
-        cursor.execute("""
-            SELECT COUNT(*) FROM users 
-            WHERE last_seen > ?
-        """, (week_ago,))
-        active_7d = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*) FROM users WHERE is_blocked = 1")
-        blocked_count = cursor.fetchone()[0]
-
-        cursor.execute("""
-            SELECT first_name, username, message_count 
-            FROM users 
-            ORDER BY message_count DESC 
-            LIMIT 5
-        """)
-        top_users = cursor.fetchall()
+    total_users = await db.get_total_users()
+    total_messages = await db.get_total_messages()
+
+    active_24h = await db.count_active_users(datetime.now() - timedelta(days=1))
+    active_7d = await db.count_active_users(datetime.now() - timedelta(days=7))
+    blocked_count = await db.count_blocked_users()
+    top_users = await db.get_top_users(limit=5)
+    cache = db.user_cache
+    history_cache = db.history_cache
+    pools = []
+    for name in http_clients.providers:
+        summary = http_clients.summary(name)
+        if summary:
+            pools.append(f"🌐 {name}: {summary}")
+    pool_text = "\n".join(pools) or "🌐 No requests yet"
+    streaming = stream_stats.summary()
+    if streaming:
+        pool_text += f"\n⚡ Streaming: {streaming}"
+    prompts = prompt_builder.summary()
+    if prompts:
+        pool_text += f"\n📝 Prompts: {prompts}"
+    queue = scheduler.summary()
+    if queue:
+        pool_text += f"\n🚦 Queue: {queue}"
+    recorded = background.summary()
+    if recorded:
+        pool_text += f"\n🗂 Background: {recorded}"
+    bursts = debouncer.summary()
+    if bursts:
+        pool_text += f"\n🧩 Bursts: {bursts}"
+    provider_text = "\n".join(f"🔁 {line}" for line in providers.summary()) or "🔁 No providers available"
 
     stats_text = f"""**Bot Statistics (Admin Panel)**
 
@@ -58,12 +65,23 @@ async def stats_admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE
 💬 Total Messages: {total_messages}
 📨 Avg per User: {total_messages // total_users if total_users > 0 else 0}
 
+**User Cache:**
+🗄 {len(cache)} rows, {cache.hits} hits / {cache.misses} misses ({cache.hit_rate:.0%})
+💭 History: {len(history_cache)} users, {history_cache.size / 1024 / 1024:.1f} MiB, {history_cache.hit_rate:.0%} hits
+
+**LLM Connections:**
+{pool_text}
+
+**Reply Providers:**
+{provider_text}
+
 **Top 5 Active Users:**
 """
 
-    for i, (name, username, msg_count) in enumerate(top_users, 1):
+    for i, top_user in enumerate(top_users, 1):
+        username = top_user["username"]
         username_str = f"@{username}" if username else "No username"
-        stats_text += f"{i}. {name} ({username_str}): {msg_count} msgs\n"
+        stats_text += f"{i}. {top_user['first_name']} ({username_str}): {top_user['message_count']} msgs\n"
 
     await update.message.reply_text(stats_text, parse_mode="Markdown")
 
@@ -83,11 +101,7 @@ async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = " ".join(context.args)
 
     # Get all users
-    import sqlite3
-    with sqlite3.connect(DATABASE_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_id FROM users WHERE is_blocked = 0")
-        users = cursor.fetchall()
+    users = await db.get_unblocked_user_ids()
 
     total_users = len(users)
 
@@ -126,7 +140,7 @@ async def confirm_broadcast_command(update: Update, context: ContextTypes.DEFAUL
     success_count = 0
     failed_count = 0
 
-    for i, (user_id,) in enumerate(users, 1):
+    for i, user_id in enumerate(users, 1):
         try:
             await context.bot.send_message(chat_id=user_id, text=message)
             success_count += 1
@@ -165,7 +179,9 @@ async def block_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     try:
         user_id = int(context.args[0])
-        db.block_user(user_id)
+        if not await db.block_user(user_id):
+            await update.message.reply_text(f"❌ User `{user_id}` has never talked to me.", parse_mode="Markdown")
+            return
         await update.message.reply_text(f"✅ User `{user_id}` has been blocked.", parse_mode="Markdown")
         logger.info(f"Admin {update.effective_user.id} blocked user {user_id}")
     except ValueError:
@@ -180,12 +196,49 @@ async def unblock_user_command(update: Update, context: ContextTypes.DEFAULT_TYP
 
     try:
         user_id = int(context.args[0])
-        db.unblock_user(user_id)
+        if not await db.unblock_user(user_id):
+            await update.message.reply_text(f"❌ User `{user_id}` has never talked to me.", parse_mode="Markdown")
+            return
         await update.message.reply_text(f"✅ User `{user_id}` has been unblocked.", parse_mode="Markdown")
         logger.info(f"Admin {update.effective_user.id} unblocked user {user_id}")
     except ValueError:
         await update.message.reply_text("❌ Invalid user ID. Must be a number.")
 
+@admin_only
+async def rebuild_counters_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Recount the global counters from the users table (Admin only)."""
+    changes = await db.rebuild_counters()
+
+    lines = ["**Counter Check:**"]
+    drifted = 0
+    for name, (stored, actual) in changes.items():
+        if stored == actual:
+            lines.append(f"✅ `{name}`: {actual}")
+        else:
+            drifted += 1
+            lines.append(f"⚠️ `{name}`: {stored} → {actual}")
+    lines.append("")
+    lines.append(f"Fixed {drifted} counter(s)." if drifted else "All counters were consistent.")
+
+    await update.message.reply_text("\n".join(lines), parse_mode="Markdown")
+    logger.info(f"Admin {update.effective_user.id} rebuilt counters ({drifted} drifted)")
+
+@admin_only
+async def reload_persona_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Reload persona.json without restarting (Admin only)."""
+    try:
+        persona = reload_persona()
+        await update.message.reply_text(
+            f"✅ Persona reloaded successfully!\n"
+            f"Loaded {len(persona.intents)} intents, "
+            f"{len(persona.responses) + len(persona.warmth_responses)} response pools"
+        )
+        logger.info(f"Admin {update.effective_user.id} reloaded persona")
+    except Exception as e:
+        await update.message.reply_text(f"❌ Failed to reload persona, keeping the current one: {e}")
+        logger.error(f"Failed to reload persona: {e}")
+
+
 def register_admin_handlers(application):
 
     application.add_handler(CommandHandler("astats", stats_admin_command))
@@ -193,3 +246,5 @@ def register_admin_handlers(application):
     application.add_handler(CommandHandler("confirm_broadcast", confirm_broadcast_command))
     application.add_handler(CommandHandler("block", block_user_command))
     application.add_handler(CommandHandler("unblock", unblock_user_command))
+    application.add_handler(CommandHandler("rebuild_counters", rebuild_counters_command))
+    application.add_handler(CommandHandler("reload_persona", reload_persona_command))
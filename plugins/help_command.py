@@ -36,6 +36,8 @@ Just talk to me normally and I'll respond in Hinglish. I remember our recent con
 /confirm_broadcast - Confirm pending broadcast
 /block <user_id> - Block a user
 /unblock <user_id> - Unblock a user
+/rebuild\\_counters - Recount global stats counters
+/reload\\_persona - Reload persona.json
 /sticker_guide - Guide to setup stickers
 /reload_stickers - Reload stickers.json
 
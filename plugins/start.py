@@ -1,18 +1,18 @@
 from telegram import Update
 from telegram.ext import ContextTypes
-from db.database import Database
+from db import get_async_database
 from config import DATABASE_PATH
 from utils import check_blocked
 import logging
 
 logger = logging.getLogger(__name__)
-db = Database(DATABASE_PATH)
+db = get_async_database(DATABASE_PATH)
 
 @check_blocked
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
 
-    db.add_user(
+    await db.add_user(
         user_id=user.id,
         username=user.username or "",
         first_name=user.first_name,
@@ -4,14 +4,14 @@ Statistics command handler (Admin Only)
 
 from telegram import Update
 from telegram.ext import ContextTypes
-from db.database import Database
+from db import get_async_database
 from config import DATABASE_PATH
 from utils.block_list import check_blocked
 from utils.admin import admin_only
 import logging
 
 logger = logging.getLogger(__name__)
-db = Database(DATABASE_PATH)
+db = get_async_database(DATABASE_PATH)
 
 
 @admin_only
@@ -21,9 +21,9 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
 
     # Get user stats
-    user = db.get_user(user_id)
-    total_users = db.get_total_users()
-    total_messages = db.get_total_messages()
+    user = await db.get_user(user_id)
+    total_users = await db.get_total_users()
+    total_messages = await db.get_total_messages()
 
     if user:
         user_message_count = user.get("message_count", 0)
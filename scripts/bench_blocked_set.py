@@ -0,0 +1,92 @@
+"""
+Compare memory and lookup cost of the blocked-user representations
+
+Usage:
+    python -m scripts.bench_blocked_set --users 1000000 --blocked-ratio 0.01
+"""
+
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from db.blocked_set import BlockedUserSet  # noqa: E402
+from db.database import Database  # noqa: E402
+
+
+def measure_memory(build):
+    """Return (object, bytes allocated while building it)."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, after - before
+
+
+def measure_lookups(container, probes) -> float:
+    """Return mean nanoseconds per membership check."""
+    started = time.perf_counter_ns()
+    for user_id in probes:
+        user_id in container
+    return (time.perf_counter_ns() - started) / len(probes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--blocked-ratio", type=float, default=0.01)
+    parser.add_argument("--probes", type=int, default=200_000)
+    parser.add_argument("--db", default="", help="also time loading from a synthetic database at this path")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    # Telegram ids are large, sparse integers
+    user_ids = rng.sample(range(10**8, 8 * 10**9), args.users)
+    blocked = [user_id for user_id in user_ids if rng.random() < args.blocked_ratio]
+    probes = [rng.choice(user_ids) for _ in range(args.probes)]
+
+    print(f"{args.users:,} users, {len(blocked):,} blocked, {args.probes:,} lookups (seed {args.seed})\n")
+
+    candidates = {
+        "BlockedUserSet (sorted array)": lambda: BlockedUserSet(blocked),
+        "set() of blocked ids": lambda: set(blocked),
+        "dict of every user -> is_blocked": lambda: {user_id: 0 for user_id in user_ids},
+        "cached row dict per user": lambda: {
+            user_id: {"user_id": user_id, "is_blocked": 0, "user_level": 0, "message_count": 0}
+            for user_id in user_ids
+        },
+    }
+
+    print(f"{'structure':<36}{'memory':>14}{'lookup':>12}")
+    for name, build in candidates.items():
+        container, nbytes = measure_memory(build)
+        lookup_ns = measure_lookups(container, probes)
+        print(f"{name:<36}{nbytes / 1024 / 1024:>11.2f}MiB{lookup_ns:>10.0f}ns")
+        del container
+
+    if args.db:
+        path = Path(args.db)
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{path}{suffix}").unlink(missing_ok=True)
+        blocked_ids = set(blocked)
+        db = Database(str(path))
+        with db._transaction() as cursor:
+            cursor.executemany(
+                "INSERT INTO users (user_id, first_name, is_blocked) VALUES (?, ?, ?)",
+                ((user_id, "User", 1 if user_id in blocked_ids else 0) for user_id in user_ids),
+            )
+        started = time.perf_counter()
+        loaded = BlockedUserSet(db.get_blocked_user_ids())
+        elapsed = (time.perf_counter() - started) * 1000
+        db.close()
+        print(f"\nStartup load of {len(loaded):,} blocked ids from {args.users:,} users: {elapsed:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
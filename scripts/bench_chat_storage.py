@@ -0,0 +1,171 @@
+"""
+Compare size and throughput of the legacy and compact chat_history formats
+
+Usage:
+    python -m scripts.bench_chat_storage --rows 200000 --llm-ratio 0.3
+"""
+
+import argparse
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from db.chat_codec import ChatCodec  # noqa: E402
+from db.database import Database, migrate_chat_history  # noqa: E402
+from utils.chat_engine import MikuChatEngine  # noqa: E402
+
+LEGACY_SCHEMA = """
+    CREATE TABLE chat_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        message TEXT,
+        response TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX idx_chat_history_user_time ON chat_history (user_id, timestamp, id);
+"""
+
+MESSAGES = [
+    "hi", "hello miku", "kya haal hai", "tell me about sengoku history", "what music do you like?",
+    "I have an exam tomorrow", "you are cute", "I feel sad today", "thanks yaar", "bye",
+    "what are your sisters like?", "kuch khaya?", "who are you", "acha", "hmm okay",
+]
+
+LLM_WORDS = (
+    "yaar history Sengoku period Nobunaga strategy interesting matcha headphones music "
+    "study focus theek hai acha samajh aaya sisters family seriously kya bakwas hai "
+    "but honestly I think tum sahi keh rahe ho ... battle Okehazama tactics"
+).split()
+
+
+def synthetic_rows(count: int, users: int, llm_ratio: float, seed: int):
+    """Yield (user_id, message, response, epoch, canned) like real traffic."""
+    rng = random.Random(seed)
+    engine = MikuChatEngine(seed=seed)
+    now = int(time.time())
+    for i in range(count):
+        user_id = rng.randint(1, users)
+        message = rng.choice(MESSAGES)
+        if rng.random() < llm_ratio:
+            words = rng.randint(25, 110)
+            response = " ".join(rng.choice(LLM_WORDS) for _ in range(words)).capitalize() + "."
+            canned = False
+        else:
+            response = engine.get_response(message, user_id)
+            canned = True
+        yield user_id, message, response, now - (count - i), canned
+
+
+def db_size(path: Path) -> int:
+    return sum(Path(f"{path}{suffix}").stat().st_size
+               for suffix in ("", "-wal") if Path(f"{path}{suffix}").exists())
+
+
+def remove(path: Path):
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+
+
+def time_reads(read, users: int, repeat: int, seed: int) -> float:
+    """Return get_chat_history(6) calls per second."""
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        read(rng.randint(1, users))
+    return repeat / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", help="directory for the benchmark databases (default: a temporary one, removed after)")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--users", type=int, default=5_000)
+    parser.add_argument("--llm-ratio", type=float, default=0.3, help="share of rows with LLM replies")
+    parser.add_argument("--batch", type=int, default=500, help="rows per write transaction")
+    parser.add_argument("--reads", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.dir:
+        out = Path(args.dir)
+        out.mkdir(parents=True, exist_ok=True)
+        run(out, args)
+    else:
+        with tempfile.TemporaryDirectory(prefix="bench_chat_storage-") as workdir:
+            run(Path(workdir), args)
+
+
+def run(out: Path, args):
+    legacy_path, compact_path, migrated_path = out / "legacy.sqlite", out / "compact.sqlite", out / "migrated.sqlite"
+    for path in (legacy_path, compact_path, migrated_path):
+        remove(path)
+
+    rows = list(synthetic_rows(args.rows, args.users, args.llm_ratio, args.seed))
+    print(f"{len(rows):,} exchanges, {args.users:,} users, {args.llm_ratio:.0%} LLM replies\n")
+
+    # Legacy format: inline text and TEXT timestamps
+    conn = sqlite3.connect(str(legacy_path))
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.executescript(LEGACY_SCHEMA)
+    started = time.perf_counter()
+    for i in range(0, len(rows), args.batch):
+        with conn:
+            conn.executemany(
+                "INSERT INTO chat_history (user_id, message, response, timestamp) VALUES (?, ?, ?, ?)",
+                [(user_id, message, response,
+                  datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%d %H:%M:%S"))
+                 for user_id, message, response, epoch, _ in rows[i:i + args.batch]],
+            )
+    legacy_write = len(rows) / (time.perf_counter() - started)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def legacy_read(user_id):
+        return conn.execute("""
+            SELECT message, response, timestamp FROM chat_history
+            WHERE user_id = ? ORDER BY timestamp DESC, id DESC LIMIT 6
+        """, (user_id,)).fetchall()
+
+    legacy_reads = time_reads(legacy_read, args.users, args.reads, args.seed)
+    conn.close()
+
+    # Compact format through the normal write path
+    db = Database(str(compact_path))
+    started = time.perf_counter()
+    for i in range(0, len(rows), args.batch):
+        db.apply_write_batch([], [], rows[i:i + args.batch])
+    compact_write = len(rows) / (time.perf_counter() - started)
+    db._connect().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    compact_reads = time_reads(lambda user_id: db.get_chat_history(user_id, 6), args.users, args.reads, args.seed)
+    dictionary_size = len(db.codec)
+    db.close()
+
+    # Migration of the legacy file
+    shutil.copy(legacy_path, migrated_path)
+    conn = sqlite3.connect(str(migrated_path))
+    started = time.perf_counter()
+    migrate_chat_history(conn, ChatCodec())
+    migrate_rate = len(rows) / (time.perf_counter() - started)
+    conn.execute("VACUUM")
+    conn.close()
+
+    legacy_size, compact_size, migrated_size = db_size(legacy_path), db_size(compact_path), db_size(migrated_path)
+    print(f"{'format':<12}{'size':>12}{'bytes/row':>12}{'writes/s':>12}{'reads/s':>12}")
+    print(f"{'legacy':<12}{legacy_size / 1024 / 1024:>9.1f}MiB{legacy_size / len(rows):>12.0f}"
+          f"{legacy_write:>12,.0f}{legacy_reads:>12,.0f}")
+    print(f"{'compact':<12}{compact_size / 1024 / 1024:>9.1f}MiB{compact_size / len(rows):>12.0f}"
+          f"{compact_write:>12,.0f}{compact_reads:>12,.0f}")
+    print(f"\nCompact file is {compact_size / legacy_size:.0%} of legacy "
+          f"({dictionary_size} canned responses in the dictionary)")
+    print(f"Migrated legacy file: {migrated_size / 1024 / 1024:.1f} MiB after VACUUM, "
+          f"migration ran at {migrate_rate:,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
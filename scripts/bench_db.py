@@ -0,0 +1,150 @@
+"""
+Benchmark Database queries on a synthetic database, with and without the secondary indexes
+
+Usage:
+    python -m scripts.bench_db --users 100000 --messages 2000000
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from db.database import Database, INDEXES  # noqa: E402
+
+CHUNK_SIZE = 50_000
+
+
+def populate(db: Database, users: int, messages: int, seed: int):
+    """Fill an empty database with synthetic users and chat history."""
+    rng = random.Random(seed)
+    now = datetime.now()
+    conn = db._connect()
+
+    print(f"Populating {users:,} users and {messages:,} chat rows...")
+    started = time.perf_counter()
+
+    with conn:
+        conn.executemany("""
+            INSERT INTO users (user_id, username, first_name, last_name, is_blocked,
+                               message_count, first_seen, last_seen)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            (user_id, f"user{user_id}", f"Name{user_id % 5000}", "",
+             1 if rng.random() < 0.001 else 0, rng.randint(0, 500),
+             now - timedelta(days=rng.randint(30, 365)), now - timedelta(minutes=rng.randint(0, 60 * 24 * 30)))
+            for user_id in range(1, users + 1)
+        ))
+
+    inserted = 0
+    while inserted < messages:
+        batch = min(CHUNK_SIZE, messages - inserted)
+        with conn:
+            conn.executemany("""
+                INSERT INTO chat_history (user_id, message, response, timestamp)
+                VALUES (?, ?, ?, ?)
+            """, (
+                (rng.randint(1, users), "hello miku kya haal hai", "...Hello.",
+                 int(now.timestamp()) - rng.randint(0, 86400 * 90))
+                for _ in range(batch)
+            ))
+        inserted += batch
+
+    print(f"Populated in {time.perf_counter() - started:.1f}s")
+
+
+def queries(db: Database, users: int, rng: random.Random):
+    """The Database calls made by handlers, as (name, callable) pairs."""
+    yesterday = datetime.now() - timedelta(days=1)
+    week_ago = datetime.now() - timedelta(days=7)
+    return [
+        ("get_user", lambda: db.get_user(rng.randint(1, users))),
+        ("is_user_blocked", lambda: db.is_user_blocked(rng.randint(1, users))),
+        ("get_chat_history(6)", lambda: db.get_chat_history(rng.randint(1, users), limit=6)),
+        ("get_total_users", db.get_total_users),
+        ("get_total_messages", db.get_total_messages),
+        ("count_active_users(24h)", lambda: db.count_active_users(yesterday)),
+        ("count_active_users(7d)", lambda: db.count_active_users(week_ago)),
+        ("count_blocked_users", db.count_blocked_users),
+        ("get_top_users(5)", lambda: db.get_top_users(5)),
+    ]
+
+
+def measure(db: Database, users: int, repeat: int, seed: int) -> dict:
+    """Time every query and return {name: (p50_ms, p95_ms)}."""
+    rng = random.Random(seed)
+    results = {}
+    for name, call in queries(db, users, rng):
+        call()  # warm the page cache
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            call()
+            samples.append((time.perf_counter() - started) * 1000)
+        samples.sort()
+        results[name] = (statistics.median(samples), samples[int(len(samples) * 0.95) - 1])
+    return results
+
+
+def drop_indexes(db: Database):
+    with db._transaction() as cursor:
+        for name in INDEXES:
+            cursor.execute(f"DROP INDEX IF EXISTS {name}")
+        cursor.execute("ANALYZE")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", help="synthetic database file (default: one in a temporary directory, removed after)")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--messages", type=int, default=2_000_000)
+    parser.add_argument("--repeat", type=int, default=200, help="timed calls per query")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reuse", action="store_true", help="reuse an existing database at --path")
+    args = parser.parse_args()
+    if args.reuse and not args.path:
+        parser.error("--reuse needs --path")
+
+    if args.path:
+        run(Path(args.path), args)
+    else:
+        with tempfile.TemporaryDirectory(prefix="bench_db-") as workdir:
+            run(Path(workdir) / "bench_db.sqlite", args)
+
+
+def run(path: Path, args):
+    if path.exists() and not args.reuse:
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{path}{suffix}").unlink(missing_ok=True)
+
+    db = Database(str(path))
+    if not args.reuse:
+        populate(db, args.users, args.messages, args.seed)
+
+    drop_indexes(db)
+    before = measure(db, args.users, args.repeat, args.seed)
+
+    started = time.perf_counter()
+    db.close()
+    db = Database(str(path))  # _init_database recreates the indexes
+    with db._transaction() as cursor:
+        cursor.execute("ANALYZE")
+    print(f"Indexes built in {time.perf_counter() - started:.1f}s")
+    after = measure(db, args.users, args.repeat, args.seed)
+    db.close()
+
+    print(f"\n{'query':<26}{'before p50':>12}{'before p95':>12}{'after p50':>12}{'after p95':>12}{'speedup':>10}")
+    for name, (b50, b95) in before.items():
+        a50, a95 = after[name]
+        print(f"{name:<26}{b50:>10.3f}ms{b95:>10.3f}ms{a50:>10.3f}ms{a95:>10.3f}ms{b50 / a50 if a50 else 0:>9.1f}x")
+    print(f"\nDatabase size: {path.stat().st_size / 1024 / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Compare the compiled intent matcher with the original per-intent re.search chain
+
+Usage:
+    python -m scripts.bench_intents --messages 100000
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.persona import IntentMatcher, get_persona  # noqa: E402
+
+INTENTS = get_persona().intents
+
+FILLER = (
+    "the and you kya hai yaar today okay what is this that mera tum aaj kal "
+    "really maybe something nothing phir se acha theek"
+).split()
+
+
+def legacy_match(text: str):
+    """The original chain: one uncompiled re.search per intent, in order."""
+    for intent in INTENTS:
+        if "ends_with" in intent:
+            if text.endswith(intent["ends_with"]):
+                return intent["name"]
+        elif re.search(rf"\b({'|'.join(intent['keywords'])})\b", text, re.IGNORECASE):
+            return intent["name"]
+    return None
+
+
+def synthetic_messages(count: int, hit_ratio: float, seed: int):
+    """Messages of filler words, hit_ratio of them containing one intent keyword."""
+    rng = random.Random(seed)
+    keywords = [keyword for intent in INTENTS for keyword in intent.get("keywords", [])]
+    messages = []
+    for _ in range(count):
+        words = [rng.choice(FILLER) for _ in range(rng.randint(3, 15))]
+        if rng.random() < hit_ratio:
+            words.insert(rng.randint(0, len(words)), rng.choice(keywords))
+        messages.append(" ".join(words) + rng.choice(["", "", "?", "!"]))
+    return messages
+
+
+def run(match, messages) -> float:
+    """Return messages matched per second."""
+    started = time.perf_counter()
+    for message in messages:
+        match(message)
+    return len(messages) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--hit-ratio", type=float, default=0.5, help="share of messages with an intent keyword")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    messages = synthetic_messages(args.messages, args.hit_ratio, args.seed)
+    matcher = IntentMatcher(INTENTS)
+
+    mismatches = sum(legacy_match(m) != matcher.match(m) for m in messages)
+    print(f"{len(messages):,} messages, {args.hit_ratio:.0%} with a keyword, {mismatches} mismatches\n")
+
+    misses = [m for m in messages if legacy_match(m) is None]
+    print(f"{'matcher':<12}{'all msg/s':>14}{'default msg/s':>16}")
+    results = {}
+    for name, match in (("re.search", legacy_match), ("compiled", matcher.match)):
+        results[name] = (run(match, messages), run(match, misses) if misses else 0)
+        print(f"{name:<12}{results[name][0]:>14,.0f}{results[name][1]:>16,.0f}")
+
+    legacy, compiled = results["re.search"], results["compiled"]
+    print(f"\nSpeedup: {compiled[0] / legacy[0]:.1f}x overall, "
+          f"{compiled[1] / legacy[1] if legacy[1] else 0:.1f}x on messages that fall through to the default")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Build the retrieval responder's BM25 index from chat_history
+
+Indexes every (message, response) pair whose response came from an LLM;
+the persona's rule-based responses are skipped. (The responses dictionary
+is not used for this: older databases also hold retrieval replies there.)
+The bot loads the index at startup when AI_PROVIDER=retrieval.
+
+Usage:
+    python -m scripts.build_retrieval_index --path data/miku_bot.db --out data/retrieval_index.pkl
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import FrozenSet
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from db.database import Database  # noqa: E402
+from utils.persona import PERSONA_PATH, Persona  # noqa: E402
+from utils.retrieval import MAX_POSTINGS, RetrievalIndex  # noqa: E402
+
+
+def llm_pairs(db: Database, canned: FrozenSet[str], min_length: int, stats: dict, sample: list,
+              sample_size: int):
+    """Yield (message, response) pairs with LLM responses, streaming chat_history.
+
+    Also keeps a uniform sample of messages (reservoir sampling) for timing queries.
+    """
+    rng = random.Random(42)
+    for rows in db.iter_chat_history():
+        for row in rows:
+            stats["rows"] += 1
+            if row["message"]:
+                if len(sample) < sample_size:
+                    sample.append(row["message"])
+                else:
+                    slot = rng.randrange(stats["rows"])
+                    if slot < sample_size:
+                        sample[slot] = row["message"]
+            response = row["response"]
+            if not response or response in canned or len(response) < min_length:
+                continue
+            yield row["message"], response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", required=True, help="bot database file")
+    parser.add_argument("--out", required=True, help="index file to write")
+    parser.add_argument("--persona", default=PERSONA_PATH, help="persona whose rule-based responses are skipped")
+    parser.add_argument("--min-response-length", type=int, default=2, help="skip shorter responses")
+    parser.add_argument("--max-postings", type=int, default=MAX_POSTINGS,
+                        help="highest-weight postings kept per term")
+    parser.add_argument("--sample", type=int, default=1000, help="messages used to time queries")
+    args = parser.parse_args()
+
+    if not Path(args.path).exists():
+        parser.error(f"{args.path} does not exist")
+
+    canned = Persona.load(args.persona).texts()
+    db = Database(args.path)
+    stats = {"rows": 0}
+    sample = []
+    started = time.perf_counter()
+    index = RetrievalIndex.build(llm_pairs(db, canned, args.min_response_length, stats, sample, args.sample),
+                                 max_postings=args.max_postings)
+    db.close()
+    print(f"Indexed {len(index):,} of {stats['rows']:,} chat rows ({len(index.postings):,} terms, "
+          f"{len(index.responses):,} distinct responses) in {time.perf_counter() - started:.1f}s")
+
+    Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+    index.save(args.out)
+    print(f"Wrote {args.out} ({Path(args.out).stat().st_size / 1024 / 1024:.1f} MiB)")
+
+    # Time queries on a sample of real messages
+    if not sample or not len(index):
+        return
+    samples = []
+    for message in sample:
+        query_started = time.perf_counter()
+        index.query(message)
+        samples.append((time.perf_counter() - query_started) * 1000)
+    samples.sort()
+    print(f"Query latency over {len(samples):,} messages: p50 {statistics.median(samples):.3f}ms, "
+          f"p99 {samples[int(len(samples) * 0.99) - 1]:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
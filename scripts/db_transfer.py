@@ -0,0 +1,144 @@
+"""
+Stream users and chat history to and from JSONL files
+
+Export writes responses.jsonl, users.jsonl and chat_history.jsonl (with
+.gz appended when --gzip is given) into a directory. Import reads the
+same files back, plain or gzipped, in chunked transactions. Memory use
+stays constant regardless of database size.
+
+Stop the bot before importing: it keeps blocked users and cached rows
+in memory.
+
+Usage:
+    python -m scripts.db_transfer export --path data/miku_bot.db --dir backup --gzip
+    python -m scripts.db_transfer import --path data/miku_bot.db --dir backup
+"""
+
+import argparse
+import gzip
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from db.database import Database  # noqa: E402
+
+
+class Progress:
+    """Print rows done and throughput to stderr."""
+
+    def __init__(self, label: str, total: int = 0):
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.started = time.perf_counter()
+
+    def add(self, rows: int):
+        self.done += rows
+        elapsed = time.perf_counter() - self.started
+        rate = self.done / elapsed if elapsed else 0
+        total = f"/{self.total:,}" if self.total else ""
+        print(f"\r{self.label}: {self.done:,}{total} rows ({rate:,.0f} rows/s)", end="", file=sys.stderr, flush=True)
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.started
+        print(f"\r{self.label}: {self.done:,} rows in {elapsed:.1f}s "
+              f"({self.done / elapsed if elapsed else 0:,.0f} rows/s)", file=sys.stderr)
+
+
+def open_file(path: Path, mode: str):
+    if path.suffix == ".gz":
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def find_file(directory: Path, table: str) -> Path:
+    for name in (f"{table}.jsonl", f"{table}.jsonl.gz"):
+        if (directory / name).exists():
+            return directory / name
+    return None
+
+
+def export_data(db: Database, directory: Path, compress: bool, chunk_size: int):
+    directory.mkdir(parents=True, exist_ok=True)
+    suffix = ".jsonl.gz" if compress else ".jsonl"
+
+    with open_file(directory / f"responses{suffix}", "w") as f:
+        responses = db.get_responses()
+        for text in responses:
+            f.write(json.dumps({"text": text}, ensure_ascii=False) + "\n")
+    print(f"responses: {len(responses):,} rows", file=sys.stderr)
+
+    for table, chunks, total in (
+        ("users", db.iter_users(chunk_size), db.get_total_users()),
+        ("chat_history", db.iter_chat_history(chunk_size), db.get_max_chat_id()),
+    ):
+        progress = Progress(table, total)
+        with open_file(directory / f"{table}{suffix}", "w") as f:
+            for rows in chunks:
+                f.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+                progress.add(len(rows))
+        progress.finish()
+
+
+def read_chunks(path: Path, chunk_size: int):
+    """Yield lists of decoded records, chunk_size at a time."""
+    chunk = []
+    with open_file(path, "r") as f:
+        for line in f:
+            if line.strip():
+                chunk.append(json.loads(line))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_data(db: Database, directory: Path, chunk_size: int):
+    path = find_file(directory, "responses")
+    if path:
+        texts = [record["text"] for chunk in read_chunks(path, chunk_size) for record in chunk]
+        print(f"responses: {db.register_responses(texts):,} in the dictionary", file=sys.stderr)
+
+    for table, load in (("users", db.import_users), ("chat_history", db.import_chats)):
+        path = find_file(directory, table)
+        if not path:
+            print(f"{table}: no file, skipped", file=sys.stderr)
+            continue
+        progress = Progress(table)
+        for chunk in read_chunks(path, chunk_size):
+            load(chunk)
+            progress.add(len(chunk))
+        progress.finish()
+
+    # Counters are trigger-maintained; recount in case rows were overwritten oddly
+    db.rebuild_counters()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("--path", required=True, help="bot database file")
+    parser.add_argument("--dir", required=True, help="directory holding the JSONL files")
+    parser.add_argument("--gzip", action="store_true", help="gzip exported files")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="rows per query / transaction")
+    args = parser.parse_args()
+
+    if args.command == "export" and not Path(args.path).exists():
+        parser.error(f"{args.path} does not exist")
+
+    db = Database(args.path)
+    try:
+        if args.command == "export":
+            export_data(db, Path(args.dir), args.gzip, args.chunk_size)
+        else:
+            import_data(db, Path(args.dir), args.chunk_size)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""
+Offline load test: drive plugins.chat.handle_message with simulated users
+
+Starts local stub Groq and Cohere servers (scripts.stub_llm_server), points
+the bot at them and at a scratch database, and feeds handle_message fake
+Telegram updates from many concurrent users. Reports throughput, reply
+latency (message in -> first reply out) percentiles, event loop lag, the
+provider/scheduler counters and the database size. Nothing leaves the
+machine; settings not given here come from the environment as usual.
+
+It also checks the handler's ordering on every turn: the typing action
+must go out before the reply, and the exchange must be saved only after
+the reply. The run exits with status 1 if any turn breaks this. The
+check assumes DEBOUNCE_WINDOW is off, so that every message gets its own
+reply.
+
+Usage:
+    python -m scripts.load_test --users 2000 --messages 3 --provider groq --latency 0.4
+    python -m scripts.load_test --users 500 --provider groq,cohere --error-rate 0.3 --stream
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from scripts.stub_llm_server import StubLLMServer  # noqa: E402
+
+OPENERS = ["hi", "hello", "hey miku", "kya haal hai", "good morning", "good night", "how are you", "bored"]
+WORDS = ["history", "nobunaga", "matcha", "sisters", "exam", "music", "headphones", "study", "yaar", "battle",
+         "sengoku", "today", "tired", "why", "tell", "me", "about", "your", "favourite", "really", "kya", "hai"]
+
+ERROR_REPLY = "...Sorry, I'm having trouble thinking right now. Try again later."
+RATE_LIMITED_PREFIX = "...Thoda slow down karo yaar."
+
+
+class FakeChat:
+    """Per-user chat: records replies and when each turn's typing and reply went out.
+
+    The typing action takes typing_delay seconds, like a slow Telegram call.
+    """
+
+    def __init__(self, chat_id: int, typing_delay: float = 0.0):
+        self.id = chat_id
+        self.typing_delay = typing_delay
+        self.replies: List[str] = []
+        self.stickers = 0
+        self.waiter: Optional[asyncio.Future] = None
+        # {"sent", "typing", "reply", "text"} per message, in order
+        self.turns: List[Dict] = []
+
+    def start_turn(self) -> asyncio.Future:
+        self.turns.append({"sent": time.monotonic(), "typing": None, "reply": None, "text": None})
+        self.waiter = asyncio.get_running_loop().create_future()
+        return self.waiter
+
+    def deliver(self, text: str):
+        now = time.monotonic()
+        self.replies.append(text)
+        turn = self.turns[-1]
+        if turn["reply"] is None:
+            turn["reply"], turn["text"] = now, text
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(now)
+
+    async def send_action(self, action: str):
+        await asyncio.sleep(0)
+        if self.turns and self.turns[-1]["typing"] is None:
+            self.turns[-1]["typing"] = time.monotonic()
+        await asyncio.sleep(self.typing_delay)
+
+
+class FakeMessage:
+    """The parts of telegram.Message the chat handler uses."""
+
+    def __init__(self, chat: FakeChat, text: str = ""):
+        self.chat = chat
+        self.text = text
+
+    async def reply_text(self, text: str, **kwargs) -> "FakeMessage":
+        await asyncio.sleep(0)
+        self.chat.deliver(text)
+        return FakeMessage(self.chat, text)
+
+    async def edit_text(self, text: str, **kwargs) -> "FakeMessage":
+        await asyncio.sleep(0)
+        self.text = text
+        return self
+
+    async def reply_sticker(self, sticker: str, **kwargs) -> "FakeMessage":
+        await asyncio.sleep(0)
+        self.chat.stickers += 1
+        return FakeMessage(self.chat)
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.username = f"load{user_id}"
+        self.first_name = f"Load {user_id}"
+        self.last_name = ""
+
+
+class FakeUpdate:
+    def __init__(self, user: FakeUser, chat: FakeChat, text: str):
+        self.effective_user = user
+        self.effective_chat = chat
+        self.message = FakeMessage(chat, text)
+
+
+class LoopLagMonitor:
+    """Measure how late the event loop runs a callback scheduled every `interval` seconds."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.lags_ms: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags_ms.append(max(time.monotonic() - expected, 0) * 1000)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        self._task.cancel()
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0.0
+
+
+def make_message(rng: random.Random, repeat_share: float) -> str:
+    if rng.random() < repeat_share:
+        return rng.choice(OPENERS)
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))) + f" {rng.randint(1, 10 ** 6)}?"
+
+
+async def simulate_user(handle_message, user_id: int, args, rng: random.Random, stats: Dict):
+    """Send args.messages messages, each after the previous reply plus some think time."""
+    await asyncio.sleep(rng.uniform(0, args.ramp))
+    user = FakeUser(user_id)
+    chat = FakeChat(user_id)
+    for _ in range(args.messages):
+        waiter = chat.start_turn()
+        sent = time.monotonic()
+        stats["sent"] += 1
+        try:
+            await handle_message(FakeUpdate(user, chat, make_message(rng, args.repeat_share)), None)
+            replied = await asyncio.wait_for(waiter, args.reply_timeout)
+            stats["latencies"].append((replied - sent) * 1000)
+        except asyncio.TimeoutError:
+            stats["timeouts"] += 1
+        except Exception as e:
+            stats["exceptions"] += 1
+            if stats["exceptions"] <= 3:
+                print(f"handle_message raised: {e!r}", file=sys.stderr)
+        if args.think:
+            await asyncio.sleep(rng.expovariate(1 / args.think))
+    stats["error_replies"] += sum(1 for reply in chat.replies if reply == ERROR_REPLY)
+    stats["rate_limited"] += sum(1 for reply in chat.replies if reply.startswith(RATE_LIMITED_PREFIX))
+    stats["replies"] += len(chat.replies)
+    stats["stickers"] += chat.stickers
+    stats["chats"].append(chat)
+
+
+class SaveRecorder:
+    """Wrap the write-behind record_turn to record when each user's exchanges were saved."""
+
+    def __init__(self, write_behind):
+        self.saved: Dict[int, List[float]] = {}
+        original = write_behind.record_turn
+
+        def record_turn(user_id: int, username: str, first_name: str, last_name: Optional[str], message: str,
+                        response: Optional[str], *args, **kwargs):
+            if response is not None:
+                self.saved.setdefault(user_id, []).append(time.monotonic())
+            return original(user_id, username, first_name, last_name, message, response, *args, **kwargs)
+
+        write_behind.record_turn = record_turn
+
+
+def check_order(chats: List[FakeChat], saved: Dict[int, List[float]]) -> Dict:
+    """Count turns whose typing came after the reply or whose save came before it."""
+    result = {"turns": 0, "typing_late": 0, "saved_early": 0, "typing_ms": [], "save_ms": []}
+    for chat in chats:
+        answered = [turn for turn in chat.turns if turn["reply"] is not None]
+        result["turns"] += len(answered)
+        for turn in answered:
+            if turn["typing"] is None:
+                continue  # rate limited: no typing, no reply from the model
+            result["typing_ms"].append((turn["typing"] - turn["sent"]) * 1000)
+            if turn["typing"] > turn["reply"]:
+                result["typing_late"] += 1
+        # Each turn answered by a provider is saved once, in order
+        delivered = [turn for turn in answered if turn["typing"] is not None and turn["text"] != ERROR_REPLY]
+        for turn, saved_at in zip(delivered, saved.get(chat.id, [])):
+            result["save_ms"].append((saved_at - turn["reply"]) * 1000)
+            if saved_at < turn["reply"]:
+                result["saved_early"] += 1
+    return result
+
+
+def configure(args, workdir: str, servers: List[StubLLMServer]):
+    """Point the bot at the stubs and a scratch database before anything imports config."""
+    os.environ.update({
+        "DATABASE_PATH": os.path.join(workdir, "load_test.db"),
+        "HISTORY_ARCHIVE_PATH": "",
+        "GROQ_BASE_URL": servers[0].url,
+        "COHERE_BASE_URL": servers[1].url,
+        "GROQ_API_KEY": "load-test",
+        "COHERE_API_KEY": "load-test",
+        "PROVIDER_CHAIN": args.provider,
+        "AI_PROVIDER": args.provider.split(",")[0],
+        "STREAM_REPLIES": "true" if args.stream else "false",
+        "STICKER_CHANCE": str(args.sticker_chance),
+    })
+    os.environ.setdefault("BOT_TOKEN", "0:load-test")
+
+
+async def run(args) -> Dict:
+    from config import DATABASE_PATH
+    from db import get_async_database
+    from plugins import chat
+    from utils.http_clients import http_clients
+    from utils.providers import providers
+    from utils.scheduler import scheduler
+    from utils.prompt import prompt_builder
+    from utils.background import background
+
+    db = get_async_database(DATABASE_PATH)
+    recorder = SaveRecorder(db.write_behind)
+    db.write_behind.start()
+    http_clients.start()
+    monitor = LoopLagMonitor()
+    monitor.start()
+
+    stats = {"sent": 0, "replies": 0, "timeouts": 0, "exceptions": 0, "error_replies": 0, "rate_limited": 0,
+             "stickers": 0, "latencies": [], "chats": []}
+    rng = random.Random(args.seed)
+    started = time.monotonic()
+    await asyncio.gather(*(
+        simulate_user(chat.handle_message, 10 ** 9 + user, args, random.Random(rng.random()), stats)
+        for user in range(args.users)
+    ))
+    stats["elapsed"] = time.monotonic() - started
+    # Turns are recorded after their reply; let the last ones land
+    await background.stop()
+    stats["order"] = check_order(stats["chats"], recorder.saved)
+
+    monitor.stop()
+    stats["lags"] = monitor.lags_ms
+    stats["providers"] = providers.summary()
+    stats["scheduler"] = scheduler.summary()
+    stats["prompts"] = prompt_builder.summary()
+    stats["history_cache"] = db.history_cache.hit_rate
+    await http_clients.close()
+    await db.close()
+    return stats
+
+
+def report(args, stats: Dict, servers: List[StubLLMServer], db_path: str):
+    latencies = stats["latencies"]
+    size = sum(os.path.getsize(path) for path in (db_path, f"{db_path}-wal") if os.path.exists(path))
+    print(f"\n{args.users:,} users x {args.messages} messages via {args.provider} "
+          f"(stub latency {args.latency}s +/- {args.jitter}s, {args.error_rate:.0%} errors"
+          f"{', streamed' if args.stream else ''})")
+    print(f"  sent {stats['sent']:,}, replies {stats['replies']:,}, error replies {stats['error_replies']:,}, "
+          f"rate limited {stats['rate_limited']:,}, no reply {stats['timeouts']:,}, "
+          f"handler exceptions {stats['exceptions']:,}, stickers {stats['stickers']:,}")
+    print(f"  throughput: {stats['sent'] / stats['elapsed']:.1f} messages/s over {stats['elapsed']:.1f}s")
+    if latencies:
+        print(f"  reply latency: p50 {statistics.median(latencies):.0f}ms, p95 {percentile(latencies, 0.95):.0f}ms, "
+              f"p99 {percentile(latencies, 0.99):.0f}ms, max {max(latencies):.0f}ms")
+    if stats["lags"]:
+        print(f"  event loop lag: p50 {statistics.median(stats['lags']):.1f}ms, "
+              f"p99 {percentile(stats['lags'], 0.99):.1f}ms, max {max(stats['lags']):.1f}ms")
+    print(f"  stub requests: groq {servers[0].requests:,} ({servers[0].errors:,} errors), "
+          f"cohere {servers[1].requests:,} ({servers[1].errors:,} errors)")
+    for line in stats["providers"]:
+        print(f"  provider {line}")
+    for name in ("scheduler", "prompts"):
+        if stats[name]:
+            print(f"  {name}: {stats[name]}")
+    print(f"  history cache hit rate: {stats['history_cache']:.0%}")
+    print(f"  database: {size / 1024 / 1024:.1f} MiB ({db_path})")
+    order = stats["order"]
+    print(f"  ordering over {order['turns']:,} answered turns: typing after reply {order['typing_late']}, "
+          f"saved before reply {order['saved_early']}")
+    if order["typing_ms"] and order["save_ms"]:
+        print(f"    typing sent p50 {statistics.median(order['typing_ms']):.1f}ms after the message, "
+              f"exchange saved p50 {statistics.median(order['save_ms']):.1f}ms after the reply")
+    return not order["typing_late"] and not order["saved_early"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000, help="simulated users")
+    parser.add_argument("--messages", type=int, default=3, help="messages per user")
+    parser.add_argument("--ramp", type=float, default=10.0, help="users start spread over this many seconds")
+    parser.add_argument("--think", type=float, default=1.0, help="mean seconds between a reply and the next message")
+    parser.add_argument("--repeat-share", type=float, default=0.3, help="share of messages that are common openers")
+    parser.add_argument("--provider", default="groq", help="PROVIDER_CHAIN for the run, e.g. groq,cohere,rule-based")
+    parser.add_argument("--latency", type=float, default=0.4, help="stub response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="stub latency varies by up to +/- this")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of stub requests that fail with 503")
+    parser.add_argument("--stream", action="store_true", help="run with STREAM_REPLIES=true")
+    parser.add_argument("--sticker-chance", type=float, default=0.0, help="STICKER_CHANCE for the run")
+    parser.add_argument("--reply-timeout", type=float, default=60.0, help="seconds before a message counts as unanswered")
+    parser.add_argument("--workdir", help="directory for the scratch database (default: a temporary one)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    servers = [
+        StubLLMServer(("127.0.0.1", 0), latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                      seed=args.seed + offset)
+        for offset in range(2)
+    ]
+    for server in servers:
+        server.start()
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        workdir = args.workdir or tempdir
+        configure(args, workdir, servers)
+        logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+        stats = asyncio.run(run(args))
+        ordered = report(args, stats, servers, os.environ["DATABASE_PATH"])
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+    if not ordered:
+        print("ORDERING CHECK FAILED", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
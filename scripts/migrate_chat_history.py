@@ -0,0 +1,103 @@
+"""
+Migrate an existing bot database to the compact chat_history format
+
+The bot also migrates automatically on startup; this tool does it offline
+with progress output and an optional VACUUM to give the space back.
+--incremental-vacuum switches the file to incremental auto-vacuum (also
+a full rebuild), which the retention job needs to return archived space
+in small steps. Run it while the bot is stopped.
+
+Usage:
+    python -m scripts.migrate_chat_history --path data/miku_bot.db --vacuum
+    python -m scripts.migrate_chat_history --path data/miku_bot.db --incremental-vacuum
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from db.chat_codec import ChatCodec, COMPRESS_MIN_LENGTH  # noqa: E402
+from db.database import Database, is_legacy_chat_history, migrate_chat_history  # noqa: E402
+
+
+def file_size(path: Path) -> int:
+    return sum(Path(f"{path}{suffix}").stat().st_size
+               for suffix in ("", "-wal") if Path(f"{path}{suffix}").exists())
+
+
+def enable_incremental_vacuum(path: Path, compress_min_length: int):
+    size_before = file_size(path)
+    started = time.perf_counter()
+    db = Database(str(path), compress_min_length=compress_min_length)
+    try:
+        if not db.enable_incremental_vacuum():
+            print("Already using incremental auto-vacuum.")
+            return
+    finally:
+        db.close()
+    print(f"Switched to incremental auto-vacuum in {time.perf_counter() - started:.1f}s: "
+          f"{size_before / 1024 / 1024:.1f} MiB -> {file_size(path) / 1024 / 1024:.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", required=True, help="database file to migrate in place")
+    parser.add_argument("--min-repeats", type=int, default=3,
+                        help="store responses repeated this often in the responses dictionary")
+    parser.add_argument("--compress-min-length", type=int, default=COMPRESS_MIN_LENGTH,
+                        help="zlib-compress text at least this many bytes long (0 = off)")
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM afterwards to shrink the file")
+    parser.add_argument("--incremental-vacuum", action="store_true",
+                        help="switch the file to incremental auto-vacuum (rebuilds it once)")
+    args = parser.parse_args()
+
+    path = Path(args.path)
+    if not path.exists():
+        parser.error(f"{path} does not exist")
+
+    conn = sqlite3.connect(str(path))
+    if not is_legacy_chat_history(conn):
+        conn.close()
+        print("chat_history is already in the compact format (or missing); nothing to migrate.")
+        if args.incremental_vacuum:
+            enable_incremental_vacuum(path, args.compress_min_length)
+        return
+
+    total = conn.execute("SELECT COUNT(*) FROM chat_history").fetchone()[0]
+    size_before = file_size(path)
+    print(f"Migrating {total:,} rows ({size_before / 1024 / 1024:.1f} MiB)...")
+
+    started = time.perf_counter()
+
+    def progress(done: int):
+        elapsed = time.perf_counter() - started
+        rate = done / elapsed if elapsed else 0
+        print(f"\r  {done:,}/{total:,} rows ({rate:,.0f} rows/s)", end="", flush=True)
+
+    codec = ChatCodec(args.compress_min_length)
+    migrated = migrate_chat_history(conn, codec, min_repeats=args.min_repeats,
+                                    chunk_size=args.chunk_size, progress=progress)
+    print(f"\nMigrated {migrated:,} rows in {time.perf_counter() - started:.1f}s, "
+          f"{len(codec):,} responses in the dictionary")
+
+    if args.vacuum:
+        print("Vacuuming...")
+        conn.execute("VACUUM")
+    conn.close()
+
+    # Recreate indexes, counters and the rest of the current schema
+    Database(str(path), compress_min_length=args.compress_min_length).close()
+    if args.incremental_vacuum:
+        enable_incremental_vacuum(path, args.compress_min_length)
+
+    size_after = file_size(path)
+    print(f"Size: {size_before / 1024 / 1024:.1f} MiB -> {size_after / 1024 / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Local stand-in for the Groq and Cohere chat APIs, for testing failover, breakers and hedging
+
+Serves /openai/v1/chat/completions (Groq, OpenAI format) and /v2/chat
+(Cohere) on one port, with configurable latency, jitter and error rate.
+Requests with "stream": true get a server-sent events stream. Point the
+bot at it with GROQ_BASE_URL / COHERE_BASE_URL, e.g. two stubs:
+
+    python -m scripts.stub_llm_server --port 8901 --error-rate 0.5
+    python -m scripts.stub_llm_server --port 8902 --latency 0.3
+    GROQ_BASE_URL=http://127.0.0.1:8901 COHERE_BASE_URL=http://127.0.0.1:8902 \\
+        GROQ_API_KEY=x COHERE_API_KEY=x PROVIDER_CHAIN=groq,cohere,rule-based python main.py
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+REPLY = "...Hello. It's nice to hear from you."
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer with the stub's behaviour settings and request counts."""
+
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.2, jitter: float = 0.0, error_rate: float = 0.0,
+                 reply: str = REPLY, chunk_delay: float = 0.05, seed: Optional[int] = None):
+        super().__init__(address, StubHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.reply = reply
+        self.chunk_delay = chunk_delay
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> threading.Thread:
+        """Serve from a daemon thread (for use inside other scripts)."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real APIs, so the bot's connection pool is exercised
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_events(self, events):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for event in events:
+            data = f"data: {event if isinstance(event, str) else json.dumps(event)}\n\n".encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+            time.sleep(self.server.chunk_delay)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with server.lock:
+            server.requests += 1
+            failing = server.rng.random() < server.error_rate
+            delay = max(server.latency + server.rng.uniform(-server.jitter, server.jitter), 0)
+            if failing:
+                server.errors += 1
+        time.sleep(delay)
+
+        if self.path not in ("/openai/v1/chat/completions", "/v2/chat"):
+            self._send_json(404, {"error": "not found"})
+            return
+        if failing:
+            self._send_json(503, {"error": "stub failure"})
+            return
+
+        words = [word + " " for word in server.reply.split(" ")]
+        if self.path == "/v2/chat":
+            if body.get("stream"):
+                self._send_events([
+                    {"type": "content-delta", "delta": {"message": {"content": {"text": word}}}}
+                    for word in words
+                ] + [{"type": "message-end"}])
+            else:
+                self._send_json(200, {"message": {"content": [{"type": "text", "text": server.reply}]}})
+        elif body.get("stream"):
+            self._send_events([{"choices": [{"delta": {"content": word}}]} for word in words] + ["[DONE]"])
+        else:
+            self._send_json(200, {"choices": [{"message": {"role": "assistant", "content": server.reply}}]})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before each response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="latency varies by up to +/- this")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--chunk-delay", type=float, default=0.05, help="seconds between streamed chunks")
+    args = parser.parse_args()
+
+    server = StubLLMServer((args.host, args.port), latency=args.latency, jitter=args.jitter,
+                           error_rate=args.error_rate, chunk_delay=args.chunk_delay)
+    print(f"Stub LLM API on {server.url} (latency {args.latency}s +/- {args.jitter}s, "
+          f"{args.error_rate:.0%} errors)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Served {server.requests} requests ({server.errors} errors)")
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
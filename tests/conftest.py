@@ -0,0 +1,33 @@
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# config.py reads these at import; keep the tests off any real .env values and database
+os.environ.setdefault("BOT_TOKEN", "1:test")
+os.environ.setdefault("ADMIN_IDS", "1")
+os.environ.setdefault("OWNER_ID", "1")
+os.environ.setdefault("LOG_CHAT_ID", "1")
+# Replies from the local rule-based provider only, with no stickers or streaming
+os.environ.setdefault("AI_PROVIDER", "rule-based")
+os.environ.setdefault("PROVIDER_CHAIN", "rule-based")
+os.environ.setdefault("STREAM_REPLIES", "false")
+os.environ.setdefault("STICKER_CHANCE", "0")
+os.environ.setdefault("DEBOUNCE_WINDOW", "0")
+os.environ.setdefault("HISTORY_ARCHIVE_PATH", "")
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(prefix="miku-tests-"), "miku_bot.db"))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def database(tmp_path):
+    """A fresh AsyncDatabase in a temporary directory, closed after the test."""
+    from db.async_database import AsyncDatabase
+
+    database = AsyncDatabase(str(tmp_path / "miku_bot.db"))
+    yield database
+    asyncio.run(database.close())
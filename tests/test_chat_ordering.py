@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from scripts.load_test import FakeChat, FakeUpdate, FakeUser, SaveRecorder, check_order
+from utils.background import BackgroundQueue
+
+
+@pytest.fixture
+def chat(database, monkeypatch):
+    """plugins.chat wired to the test's database and its own background queue."""
+    import utils.block_list
+    import utils.providers
+    from plugins import chat
+
+    for module in (chat, utils.block_list, utils.providers):
+        monkeypatch.setattr(module, "db", database)
+    # A queue per test, since each test runs its own event loop
+    monkeypatch.setattr(chat, "background", BackgroundQueue())
+    return chat
+
+
+async def send(chat, update: FakeUpdate):
+    update.message.chat.start_turn()
+    await chat.handle_message(update, None)
+
+
+def test_reply_goes_out_before_the_turn_is_recorded(chat):
+    recorder = SaveRecorder(chat.db.write_behind)
+
+    async def run():
+        user = FakeUser(2001)
+        # A slow typing action must not hold up the reply
+        fake_chat = FakeChat(user.id, typing_delay=0.2)
+        await send(chat, FakeUpdate(user, fake_chat, "hello"))
+
+        order = check_order([fake_chat], recorder.saved)
+        assert (order["turns"], order["typing_late"], order["saved_early"]) == (1, 0, 0)
+        assert len(order["save_ms"]) == 1
+        turn = fake_chat.turns[0]
+        assert turn["reply"] < turn["typing"] + fake_chat.typing_delay
+
+        # The exchange and the count are visible to the user's next turn before any flush
+        history = await chat.db.get_chat_history(user.id)
+        assert [row["message"] for row in history] == ["hello"]
+        assert (await chat.db.get_user(user.id))["message_count"] == 1
+        await chat.background.stop()
+
+    asyncio.run(run())
+
+
+def test_turns_are_recorded_in_answer_order(chat):
+    async def run():
+        user = FakeUser(2002)
+        fake_chat = FakeChat(user.id)
+        for text in ("one", "two", "three"):
+            await send(chat, FakeUpdate(user, fake_chat, text))
+
+        history = await chat.db.get_chat_history(user.id)
+        assert [row["message"] for row in history] == ["three", "two", "one"]
+        assert (await chat.db.get_user(user.id))["message_count"] == 3
+        await chat.background.stop()
+
+    asyncio.run(run())
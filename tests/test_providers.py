@@ -0,0 +1,174 @@
+import asyncio
+import time
+
+from utils.providers import CircuitBreaker, NoReply, Provider, ProviderChain, RemoteProvider
+from utils.response_cache import ResponseCache
+from utils.scheduler import LLMScheduler
+
+
+class FakeRemote(RemoteProvider):
+    """Answers `reply` after `latency` seconds, or raises `error`."""
+
+    def __init__(self, name, reply=None, latency=0.0, error=None, scheduler=None):
+        self.name = name
+        self.reply = reply or f"{name} reply"
+        self.latency = latency
+        self.error = error
+        self.scheduler = scheduler or LLMScheduler(concurrency=4, queue_size=4, max_wait=5, quotas={})
+        self.calls = 0
+
+    def slot(self, user_id, tokens):
+        return self.scheduler.slot(self.name, tokens)
+
+    async def build_request(self, user_id, message, message_count):
+        return {"message": message}, 10
+
+    async def send(self, request):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.error is not None:
+            raise self.error
+        return self.reply
+
+    async def send_stream(self, request):
+        yield await self.send(request)
+
+
+class FakeLocal(Provider):
+    name = "local"
+    canned = True
+
+    def __init__(self, reply="local reply"):
+        self.reply = reply
+
+    async def generate(self, user_id, message, message_count):
+        if self.reply is None:
+            raise NoReply("nothing to say")
+        return self.reply
+
+
+def test_chain_falls_back_in_order():
+    failing = FakeRemote("a", error=RuntimeError("boom"))
+    second = FakeRemote("b")
+    chain = ProviderChain([failing, second, FakeLocal()], hedge=False)
+
+    response, provider = asyncio.run(chain.generate(1, "hi", 1))
+
+    assert (response, provider) == ("b reply", second)
+    assert chain.stats["a"].failed == 1
+    assert chain.stats["b"].served == 1
+
+
+def test_chain_skips_open_breakers_and_no_reply():
+    remote = FakeRemote("a")
+    silent = FakeLocal(reply=None)
+    silent.name = "silent"
+    last = FakeLocal()
+    chain = ProviderChain([remote, silent, last], hedge=False)
+    chain.breakers["a"].opened_at = time.monotonic()
+
+    response, provider = asyncio.run(chain.generate(1, "hi", 1))
+
+    assert (response, provider) == ("local reply", last)
+    assert remote.calls == 0
+    # NoReply is not a failure
+    assert chain.stats["silent"].failed == 0
+
+
+def test_timeout_does_not_cover_the_scheduler_wait():
+    busy = LLMScheduler(concurrency=1, queue_size=4, max_wait=5, quotas={})
+    remote = FakeRemote("a", latency=0.01, scheduler=busy)
+    chain = ProviderChain([remote, FakeLocal()], timeout=0.1, hedge=False)
+
+    async def run():
+        await busy.acquire("a")
+        asyncio.get_running_loop().call_later(0.2, busy.release)
+        return await chain.generate(1, "hi", 1)
+
+    response, provider = asyncio.run(run())
+
+    assert (response, provider) == ("a reply", remote)
+    assert chain.breakers["a"].results[-1][1] < 0.1
+
+
+def test_breaker_opens_then_closes_after_a_good_trial():
+    breaker = CircuitBreaker("a", window=4, min_calls=2, failure_rate=0.5, slow_seconds=1, cooldown=0.05)
+    breaker.record(False, 0.01)
+    assert breaker.state == "closed"
+    breaker.record(False, 0.01)
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    # Only one trial call at a time
+    assert not breaker.allow()
+    breaker.record(True, 0.01)
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_breaker_reopens_after_a_failed_trial():
+    breaker = CircuitBreaker("a", window=4, min_calls=2, failure_rate=0.5, slow_seconds=0.5, cooldown=0.05)
+    breaker.record(True, 0.6)
+    breaker.record(True, 0.6)
+    # Slow calls count as failures
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record(False, 0.01)
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_breaker_release_frees_the_trial():
+    breaker = CircuitBreaker("a", window=4, min_calls=1, failure_rate=1, slow_seconds=1, cooldown=0)
+    breaker.record(False, 0.01)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_slow_primary_is_hedged():
+    slow = FakeRemote("a", latency=0.5)
+    fast = FakeRemote("b", latency=0.01)
+    chain = ProviderChain([slow, fast, FakeLocal()], hedge=True, hedge_min_delay=0.02)
+    for _ in range(chain.breakers["a"].min_calls):
+        chain.breakers["a"].record(True, 0.01)
+
+    response, provider = asyncio.run(chain.generate(1, "hi", 1))
+
+    assert (response, provider) == ("b reply", fast)
+    assert chain.stats["b"].hedged == 1
+    assert chain.stats["b"].hedge_wins == 1
+    assert chain.stats["a"].served == 0
+
+
+def test_no_hedge_without_latency_history():
+    slow = FakeRemote("a", latency=0.05)
+    fast = FakeRemote("b")
+    chain = ProviderChain([slow, fast, FakeLocal()], hedge=True, hedge_min_delay=0.01)
+
+    response, provider = asyncio.run(chain.generate(1, "hi", 1))
+
+    assert (response, provider) == ("a reply", slow)
+    assert fast.calls == 0
+
+
+def test_cache_fills_from_a_deterministic_provider():
+    remote = FakeRemote("a")
+    cache = ResponseCache(max_size=10, ttl=60, variants=3, history=0, seed=1)
+    chain = ProviderChain([remote, FakeLocal()], hedge=False, cache=cache)
+
+    async def run():
+        return [await chain.generate(1, "hi", 1) for _ in range(5)]
+
+    replies = asyncio.run(run())
+
+    assert [response for response, _ in replies] == ["a reply"] * 5
+    assert [provider for _, provider in replies] == [remote] * 3 + [None] * 2
+    assert remote.calls == 3
+    assert (cache.hits, cache.misses) == (2, 3)
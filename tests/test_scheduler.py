@@ -0,0 +1,58 @@
+import asyncio
+
+from utils.scheduler import LLMScheduler, Overloaded
+
+
+def test_release_skips_waiter_cancelled_while_queued():
+    async def run():
+        scheduler = LLMScheduler(concurrency=1, queue_size=4, max_wait=5, quotas={})
+        await scheduler.acquire("groq")
+        queued = asyncio.create_task(scheduler.acquire("groq"))
+        await asyncio.sleep(0)
+        assert scheduler.depth == 1
+
+        # Cancel and release in the same tick, before acquire() can drop its waiter
+        queued.cancel()
+        scheduler.release()
+        assert scheduler.active == 0
+        assert scheduler.depth == 0
+
+        await asyncio.gather(queued, return_exceptions=True)
+        await asyncio.wait_for(scheduler.acquire("groq"), 1)
+        assert scheduler.active == 1
+
+    asyncio.run(run())
+
+
+def test_full_queue_skips_cancelled_waiter():
+    async def run():
+        scheduler = LLMScheduler(concurrency=1, queue_size=1, max_wait=5, quotas={})
+        await scheduler.acquire("groq")
+        queued = asyncio.create_task(scheduler.acquire("groq"))
+        await asyncio.sleep(0)
+
+        # The queue looks full, but its only waiter was cancelled in this tick
+        queued.cancel()
+        asyncio.get_running_loop().call_later(0.01, scheduler.release)
+        await scheduler.acquire("groq", priority=0)
+        assert scheduler.active == 1
+        assert scheduler.shed == 0
+        await asyncio.gather(queued, return_exceptions=True)
+
+    asyncio.run(run())
+
+
+def test_waiter_past_deadline_is_shed():
+    async def run():
+        scheduler = LLMScheduler(concurrency=1, queue_size=4, max_wait=0.05, quotas={})
+        await scheduler.acquire("groq")
+        try:
+            await scheduler.acquire("groq")
+        except Overloaded:
+            pass
+        else:
+            raise AssertionError("expected Overloaded")
+        assert scheduler.shed == 1
+        assert scheduler.depth == 0
+
+    asyncio.run(run())
@@ -0,0 +1,71 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from db.write_behind import WriteBehindFull
+from utils.background import BackgroundQueue
+
+
+def test_poison_row_is_dropped_after_retries(database):
+    async def run():
+        queue = database.write_behind
+        queue.record_turn(1, "one", "One", "", "hi", "hello")
+        # Not text, so the whole batch fails every time
+        queue._buffer_chat(1, object(), "broken", False)
+        queue.record_turn(2, "two", "Two", "", "hey", "hello again")
+
+        for _ in range(queue.max_retries - 1):
+            with pytest.raises(Exception):
+                await queue.flush()
+            assert queue.pending_rows
+        with pytest.raises(Exception):
+            await queue.flush()
+
+        assert queue.pending_rows == 0
+        assert queue.dropped_rows == 1
+        assert (await database.get_user(1))["message_count"] == 1
+        assert (await database.get_user(2))["message_count"] == 1
+        rows = database.db.get_chat_history(2)
+        assert [row["message"] for row in rows] == ["hey"]
+
+    asyncio.run(run())
+
+
+def test_settle_raises_when_flushes_cannot_drain_the_buffer(database):
+    async def run():
+        queue = database.write_behind
+        queue.max_pending = 2
+        queue.flush_interval = 0.01
+
+        async def failing_batch(*args):
+            raise sqlite3.OperationalError("disk I/O error")
+
+        database.apply_write_batch = failing_batch
+        queue.record_turn(1, "one", "One", "", "hi", "hello")
+        with pytest.raises(WriteBehindFull):
+            await queue.settle()
+        assert queue.failed_flushes >= queue.max_retries
+        assert queue.pending_rows == 3
+
+    asyncio.run(run())
+
+
+def test_failed_flush_is_counted_by_the_background_queue(database):
+    async def run():
+        queue = database.write_behind
+        queue.batch_rows = 1
+
+        async def failing_batch(*args):
+            raise sqlite3.OperationalError("database is locked")
+
+        database.apply_write_batch = failing_batch
+        background = BackgroundQueue()
+        queue.record_turn(1, "one", "One", "", "hi", "hello")
+        await background.submit("write_behind", queue.settle)
+        await background.stop()
+
+        assert background.failed["write_behind"] == 1
+        assert queue.pending_rows == 3
+
+    asyncio.run(run())
@@ -0,0 +1,80 @@
+"""
+Bounded queue of work done after a reply has been sent
+"""
+
+import asyncio
+from collections import Counter
+from typing import Awaitable, Callable, Optional
+import logging
+
+from config import BACKGROUND_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundQueue:
+    """Run jobs off the reply path, one at a time on a worker task.
+
+    submit() waits while max_size jobs are pending, so a slow database
+    pushes back on handlers (after their reply is out) instead of growing
+    memory without bound. Failures are counted per job name and logged,
+    never raised to the submitter. The worker starts on first use; stop()
+    runs every pending job before returning.
+    """
+
+    def __init__(self, max_size: int = BACKGROUND_QUEUE_SIZE):
+        self.max_size = max_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.completed = 0
+        self.failed: Counter = Counter()
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self):
+        if self._worker is not None:
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.max_size)
+        self._worker = asyncio.create_task(self._work())
+
+    async def submit(self, name: str, job: Callable[..., Awaitable], *args):
+        """Queue job(*args) under a name used for failure accounting."""
+        self.start()
+        await self._queue.put((name, job, args))
+
+    async def _work(self):
+        while True:
+            name, job, args = await self._queue.get()
+            try:
+                await job(*args)
+                self.completed += 1
+            except Exception as e:
+                self.failed[name] += 1
+                logger.error(f"Background job {name} failed: {e!r}")
+            finally:
+                self._queue.task_done()
+
+    async def stop(self):
+        """Finish every queued job, then stop the worker."""
+        if self._worker is None:
+            return
+        await self._queue.join()
+        self._worker.cancel()
+        await asyncio.gather(self._worker, return_exceptions=True)
+        self._worker = None
+
+    def summary(self) -> Optional[str]:
+        failed = sum(self.failed.values())
+        if not self.completed and not failed:
+            return None
+        text = f"{self.completed} done, {self.pending} pending, {failed} failed"
+        if failed:
+            # Names in backticks, since the summary goes into a Markdown message
+            text += " (" + ", ".join(f"`{name}`: {count}" for name, count in self.failed.most_common()) + ")"
+        return text
+
+
+background = BackgroundQueue()
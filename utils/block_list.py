@@ -1,19 +1,19 @@
 from functools import wraps
 from telegram import Update
 from telegram.ext import ContextTypes
-from db.database import Database
+from db import get_async_database
 from config import DATABASE_PATH
 import logging
 
 logger = logging.getLogger(__name__)
-db = Database(DATABASE_PATH)
+db = get_async_database(DATABASE_PATH)
 
 def check_blocked(func):
     @wraps(func)
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
 
-        if db.is_user_blocked(user_id):
+        if await db.is_user_blocked(user_id):
             logger.info(f"Blocked user {user_id} attempted to interact")
             await update.message.reply_text(
                 "...I'm not talking to you right now."
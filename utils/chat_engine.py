@@ -1,221 +1,126 @@
 import random
-import re
-from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from config import WARMTH_CACHE_SIZE
+from utils.persona import Persona, get_persona
+
+
+class WarmthTracker:
+    """Count interactions per user_id, keeping about the max_size most recently seen.
+
+    Counts are kept in two plain dicts of user_id -> count: the current
+    generation and the previous one. A user seen again moves into the
+    current one; once it holds max_size // 2 users it becomes the
+    previous generation and the older one is dropped. That costs one
+    dict entry per user, with none of an OrderedDict's per-entry links.
+    Counts stop at MAX_COUNT, where warmth stops changing, so the values
+    are all shared small ints.
+
+    The durable copy is users.message_count, which the chat handler
+    bumps through the write-behind queue after each reply. An evicted
+    user (or any user after a restart) is seeded from it on their next
+    message, so memory stays bounded without warmth resetting.
+    """
+
+    # Interactions at which the highest warmth level starts
+    MAX_COUNT = 30
+
+    __slots__ = ("generation_size", "_current", "_previous")
+
+    def __init__(self, max_size: int = WARMTH_CACHE_SIZE):
+        self.generation_size = max(max_size // 2, 1)
+        self._current: Dict[int, int] = {}
+        self._previous: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._current) + len(self._previous)
+
+    def get(self, user_id: int) -> Optional[int]:
+        count = self._current.get(user_id)
+        return self._previous.get(user_id) if count is None else count
+
+    def next_count(self, user_id: int, message_count: Optional[int] = None) -> int:
+        """Count one more interaction and return the user's previous interactions.
+
+        message_count is the stored count including this message; it
+        seeds a user that is not in memory and catches up a user whose
+        messages went through another provider.
+        """
+        count = self.get(user_id)
+        count = 0 if count is None else count + 1
+        if message_count is not None:
+            count = max(count, message_count - 1)
+        count = min(count, self.MAX_COUNT)
+        self.put(user_id, count)
+        return count
+
+    def put(self, user_id: int, count: int):
+        count = min(count, self.MAX_COUNT)
+        if user_id in self._current:
+            self._current[user_id] = count
+            return
+        self._previous.pop(user_id, None)
+        self._current[user_id] = count
+        if len(self._current) >= self.generation_size:
+            self._previous = self._current
+            self._current = {}
 
-class MikuChatEngine:
 
-    def __init__(self):
-        self.user_interactions = {}
-
-    def get_response(self, message: str, user_name: str) -> str:
-        message_lower = message.lower()
-
-        if user_name not in self.user_interactions:
-            self.user_interactions[user_name] = 0
-        else:
-            self.user_interactions[user_name] += 1
-
-        warmth_level = min(self.user_interactions[user_name] // 10, 3)
-
-        if self._match_pattern(message_lower, [r'\b(hi|hello|hey|sup|yo|greetings|namaste|hii)\b']):
-            return self._get_greeting(warmth_level)
-
-        if self._match_pattern(message_lower, [r'\b(bye|goodbye|see you|later|gtg|gotta go|alvida|bye bye)\b']):
-            return self._get_farewell(warmth_level)
-
-        if self._match_pattern(message_lower, [r'\b(who are you|your name|about you|kaun ho|naam kya)\b']):
-            return random.choice([
-                "I'm Miku Nakano. ...Kyun puch rahe ho?",
-                "Miku. That's all you need to know yaar.",
-                "I'm Miku, one of the Nakano quintuplets.",
-            ])
-
-        if self._match_pattern(message_lower,
-                               [r'\b(history|historical|sengoku|samurai|warrior|feudal|nobunaga|tokugawa|itihaas)\b']):
-            return random.choice([
-                "Oh, history mein interested ho? Sengoku period is my favorite era.",
-                "History fascinating hai yaar. Especially the Sengoku period.",
-                "...Sengoku period ke baare mein jaante ho? Not many people appreciate history these days.",
-                "Generals like Oda Nobunaga ki strategies brilliant thi.",
-                "History study karte ho? It's one of my favorite subjects.",
-            ])
-
-        if self._match_pattern(message_lower,
-                               [r'\b(music|song|headphones|listen|audio|sound|playlist|gaana|sangeet)\b']):
-            return random.choice([
-                "I'm always listening to something yaar.",
-                "Music helps me focus. Tum kaunsa music sunते ho?",
-                "...These headphones are important to me.",
-                "I can't study without my music.",
-                "Good music can change your whole mood.",
-            ])
-
-        if self._match_pattern(message_lower, [r'\b(study|learn|school|exam|test|homework|class|grade|padhai)\b']):
-            return random.choice([
-                "Studying is important if you want to succeed.",
-                "...I usually study while listening to music.",
-                "Help chahiye studying mein? I guess I could help... maybe.",
-                "Focus karo apni studies pe. Don't slack off.",
-                "What subject padh rahe ho?",
-            ])
-
-        if self._match_pattern(message_lower,
-                               [r'\b(sister|sisters|ichika|nino|yotsuba|itsuki|quintuplet|family|behen)\b']):
-            return random.choice([
-                "...My sisters troublesome ho sakti hain sometimes.",
-                "We're quintuplets. All five of us are different.",
-                "My sisters are important to me, even if I don't show it.",
-                "...Kyun puch rahe ho mere sisters ke baare mein?",
-            ])
-
-        if self._match_pattern(message_lower,
-                               [r'\b(food|eat|hungry|lunch|dinner|breakfast|cook|matcha|drink|khana|bhook)\b']):
-            return random.choice([
-                "...I'm not picky about food yaar.",
-                "Hungry ho? You should eat something proper.",
-                "Matcha soda is my favorite drink.",
-                "...I can cook if I have to.",
-                "Aaj khana khaya tumne?",
-            ])
-
-        # Compliments
-        if self._match_pattern(message_lower,
-                               [r'\b(beautiful|pretty|cute|smart|intelligent|amazing|awesome|cool|sundar|khubsurat)\b']):
-            return random.choice([
-                "...Thanks, I guess.",
-                "Whatever yaar...",
-                "Arey, don't say embarrassing things...",
-                "...You're just saying that.",
-                "Bas karo... thanks.",
-            ])
-
-        # Love/feelings
-        if self._match_pattern(message_lower, [r'\b(love|like you|feelings|heart|crush|pyar|dil)\b']):
-            return random.choice([
-                "...Kya bol rahe ho suddenly?",
-                "Don't say weird things yaar...",
-                "...I don't know how to respond to that.",
-                "You're being too forward...",
-            ])
-
-        # Sad/negative emotions
-        if self._match_pattern(message_lower, [r'\b(sad|depressed|unhappy|lonely|alone|cry|udas|dukhi)\b']):
-            return random.choice([
-                "...Are you okay? Kya hua, you can talk to me.",
-                "Everyone feels down sometimes. It'll get better.",
-                "...Don't be sad yaar. Want to listen to some music?",
-                "Agar kisi se baat karni hai... I'm here.",
-            ])
-
-        # Happy/positive
-        if self._match_pattern(message_lower, [r'\b(happy|excited|great|amazing|wonderful|fantastic|khush|mast)\b']):
-            return random.choice([
-                "That's good to hear.",
-                "...I'm glad you're happy.",
-                "Your enthusiasm is... kind of contagious yaar.",
-                "Acha hai.",
-            ])
-
-        # Questions (ending with ?)
-        if message.endswith('?'):
-            return random.choice([
-                "Kyun puch rahe ho ye?",
-                "...I'm not sure yaar. Why do you want to know?",
-                "That's a strange question.",
-                "Hmm... sochna padega.",
-                "...Kya main answer doon iska?",
-                "I don't really know the answer.",
-                "Tum kya sochte ho?",
-            ])
-
-        # Help requests
-        if self._match_pattern(message_lower, [r'\b(help|assist|support|need you|madad)\b']):
-            return random.choice([
-                "...Kya help chahiye?",
-                "I can try to help. What's the problem?",
-                "Batao kya chahiye.",
-                "...Fine, I'll help you.",
-            ])
-
-        # Thanks
-        if self._match_pattern(message_lower, [r'\b(thank|thanks|thx|appreciate|shukriya|dhanyavaad)\b']):
-            return random.choice([
-                "...You're welcome.",
-                "It's nothing yaar.",
-                "Don't mention it.",
-                "...Whatever.",
-                "Koi baat nahi.",
-            ])
-
-        # Default responses based on warmth level
-        return self._get_default_response(warmth_level)
-
-    def _match_pattern(self, text: str, patterns: list) -> bool:
-        """Check if text matches any of the given patterns."""
-        for pattern in patterns:
-            if re.search(pattern, text, re.IGNORECASE):
-                return True
-        return False
-
-    def _get_greeting(self, warmth: int) -> str:
-        """Get greeting based on warmth level."""
-        greetings = [
-            ["...Hello.", "Oh, it's you.", "Hi... kya chahiye?", "Tum kaun ho?"],
-            ["Hi yaar.", "Hey there.", "Hello.", "Kya haal hai?"],
-            ["Hey! How are you?", "Hi! Kaisa chal raha hai?", "Hello! Good to see you."],
-            ["Hey! I was just thinking about you yaar.", "Hi! Tumse baat karke acha lagta hai.", "Hello! Kaise ho?"]
-        ]
-        return random.choice(greetings[min(warmth, 3)])
-
-    def _get_farewell(self, warmth: int) -> str:
-        """Get farewell based on warmth level."""
-        farewells = [
-            ["...See you.", "Bye.", "Later.", "Chalo bye."],
-            ["See you later yaar.", "Take care.", "Bye.", "Milte hain."],
-            ["See you soon!", "Take care of yourself.", "Goodbye yaar!", "Dhyan rakhna."],
-            ["I'll miss talking to you. See you soon!", "Take care! Talk to you later yaar!", "Bye! Jaldi aana!"]
-        ]
-        return random.choice(farewells[min(warmth, 3)])
-
-    def _get_default_response(self, warmth: int) -> str:
-        """Get default response based on warmth level."""
-        responses = [
-            # Cold (warmth 0)
-            [
-                "...I see.",
-                "Is that so?",
-                "Hmm...",
-                "...Okay.",
-                "Whatever.",
-                "...Theek hai.",
-                "Acha.",
-            ],
-            # Neutral (warmth 1)
-            [
-                "I see what you mean.",
-                "That's interesting yaar.",
-                "Hmm, samajh aaya.",
-                "Okay, I get it.",
-                "That makes sense.",
-                "Acha, theek hai.",
-            ],
-            # Warm (warmth 2)
-            [
-                "That's pretty interesting!",
-                "Tumse baat karna acha lagta hai.",
-                "Tell me more yaar.",
-                "That's a good point.",
-                "Maine aisa socha nahi tha.",
-                "Interesting perspective hai tumhara.",
-            ],
-            # Very warm (warmth 3)
-            [
-                "I really enjoy our conversations yaar.",
-                "You always have interesting things to say.",
-                "Tumse baat karke acha lagta hai.",
-                "That's really insightful!",
-                "I appreciate that you share this with me.",
-                "Tum actually samajhdar ho yaar.",
-            ]
-        ]
-        return random.choice(responses[min(warmth, 3)])
\ No newline at end of file
+class MikuChatEngine:
+    """Rule-based replies from the persona's intents and response pools.
+
+    Uses the current persona from utils.persona (so /reload_persona takes
+    effect immediately) unless one is passed in.
+    """
+
+    def __init__(self, seed: Optional[int] = None, warmth_cache_size: int = WARMTH_CACHE_SIZE,
+                 persona: Optional[Persona] = None):
+        self.warmth = WarmthTracker(warmth_cache_size)
+        self.persona = persona
+        self.rng = random.Random(seed)
+
+    def get_response(self, message: str, user_id: int, message_count: Optional[int] = None) -> str:
+        persona = self.persona or get_persona()
+
+        warmth_level = min(self.warmth.next_count(user_id, message_count) // 10, 3)
+
+        return self._pick(persona, persona.matcher.match(message.lower()), warmth_level)
+
+    def get_responses(self, batch: List[Tuple[str, int]], seed: Optional[int] = None) -> List[str]:
+        """Get responses for (message, user_id) pairs, in order.
+
+        Equivalent to calling get_response for each pair in turn (while
+        the batch's users fit in the warmth cache), but the whole batch is
+        classified in one pass and interaction counts are written back
+        once per user. Pass seed to reseed the engine's RNG
+        first, so a run can be reproduced.
+        """
+        if seed is not None:
+            self.rng.seed(seed)
+
+        persona = self.persona or get_persona()
+        intents = persona.matcher.match_many([message.lower() for message, _ in batch])
+
+        counts = {}
+        responses = []
+        for (_, user_id), intent in zip(batch, intents):
+            # Re-inserted so counts ends up in least-recently-used order
+            count = counts.pop(user_id, None)
+            if count is None:
+                count = self.warmth.get(user_id)
+            count = 0 if count is None else count + 1
+            counts[user_id] = count
+            responses.append(self._pick(persona, intent, min(count // 10, 3)))
+        for user_id, count in counts.items():
+            self.warmth.put(user_id, count)
+        return responses
+
+    def _pick(self, persona: Persona, intent: Optional[str], warmth: int) -> str:
+        """Choose a response for an intent, falling back to the default pool."""
+        if intent is None:
+            # Default responses based on warmth level
+            intent = "default"
+        tiers = persona.warmth_responses.get(intent)
+        if tiers is not None:
+            return self.rng.choice(tiers[min(warmth, len(tiers) - 1)])
+        return self.rng.choice(persona.responses[intent])
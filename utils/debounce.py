@@ -0,0 +1,113 @@
+"""
+Merge bursts of rapid messages from one user into a single turn
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import logging
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from config import DEBOUNCE_WINDOW, DEBOUNCE_MAX_WAIT, DEBOUNCE_MAX_MESSAGES
+
+logger = logging.getLogger(__name__)
+
+Responder = Callable[[Update, ContextTypes.DEFAULT_TYPE, str], Awaitable]
+
+
+class _Burst:
+    __slots__ = ("updates", "started", "last", "arrived", "task")
+
+    def __init__(self):
+        self.updates: List[Update] = []
+        self.started = self.last = time.monotonic()
+        self.arrived = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+
+class MessageDebouncer:
+    """Collect a user's messages in a chat until they pause, then answer them together.
+
+    A burst ends after `window` seconds without a new message, `max_wait`
+    seconds after its first message, or at `max_messages` messages. Its
+    texts are joined with newlines and passed to the responder once,
+    with the burst's last update (so the reply follows the last line).
+    The handler returns immediately; the wait runs in a task, so it works
+    with Telegram updates processed one at a time. flush() answers every
+    pending burst right away and waits for the replies, for shutdown.
+    """
+
+    def __init__(self, window: float = DEBOUNCE_WINDOW, max_wait: float = DEBOUNCE_MAX_WAIT,
+                 max_messages: int = DEBOUNCE_MAX_MESSAGES):
+        self.window = window
+        self.max_wait = max_wait
+        self.max_messages = max_messages
+        self._bursts: Dict[Tuple[int, int], _Burst] = {}
+        # Tasks still waiting or answering; a burst leaves _bursts before its reply is sent
+        self._tasks: Set[asyncio.Task] = set()
+        self._flushing = False
+        self.turns = 0
+        self.messages = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def add(self, update: Update, context: ContextTypes.DEFAULT_TYPE, respond: Responder):
+        """Add a message to its chat's burst, starting one if needed."""
+        key = (update.effective_chat.id, update.effective_user.id)
+        burst = self._bursts.get(key)
+        if burst is None or len(burst.updates) >= self.max_messages:
+            burst = self._bursts[key] = _Burst()
+            burst.task = asyncio.create_task(self._run(key, burst, context, respond))
+            self._tasks.add(burst.task)
+            burst.task.add_done_callback(self._tasks.discard)
+        burst.updates.append(update)
+        burst.last = time.monotonic()
+        burst.arrived.set()
+
+    async def _run(self, key: Tuple[int, int], burst: _Burst, context: ContextTypes.DEFAULT_TYPE,
+                   respond: Responder):
+        try:
+            while len(burst.updates) < self.max_messages and not self._flushing:
+                wait = min(burst.last + self.window, burst.started + self.max_wait) - time.monotonic()
+                if wait <= 0:
+                    break
+                burst.arrived.clear()
+                try:
+                    await asyncio.wait_for(burst.arrived.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # Messages from here on start the next burst
+            if self._bursts.get(key) is burst:
+                del self._bursts[key]
+
+        self.turns += 1
+        self.messages += len(burst.updates)
+        text = "\n".join(update.message.text for update in burst.updates)
+        try:
+            await respond(burst.updates[-1], context, text)
+        except Exception as e:
+            logger.error(f"Error answering a burst of {len(burst.updates)} messages: {e}")
+
+    async def flush(self):
+        """Answer every pending burst now and wait until all replies are done."""
+        self._flushing = True
+        try:
+            for burst in list(self._bursts.values()):
+                burst.arrived.set()
+            while self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+        finally:
+            self._flushing = False
+
+    def summary(self) -> Optional[str]:
+        if not self.turns:
+            return None
+        return f"{self.messages} messages answered in {self.turns} turns ({self.messages / self.turns:.1f} per turn)"
+
+
+debouncer = MessageDebouncer()
@@ -0,0 +1,114 @@
+"""
+Shared, pooled HTTP clients for the LLM providers
+"""
+
+import importlib.util
+from typing import Dict, Optional
+import logging
+
+import httpx
+
+from config import (GROQ_API_KEY, COHERE_API_KEY, GROQ_BASE_URL, COHERE_BASE_URL, HTTP_TIMEOUT,
+                    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY, HTTP2_ENABLED)
+
+logger = logging.getLogger(__name__)
+
+PROVIDERS = {
+    "groq": (GROQ_BASE_URL, GROQ_API_KEY),
+    "cohere": (COHERE_BASE_URL, COHERE_API_KEY),
+}
+
+
+class PoolStats:
+    """Requests sent and TCP connections opened by one client."""
+
+    __slots__ = ("requests", "connections")
+
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+
+    @property
+    def reused(self) -> int:
+        return max(self.requests - self.connections, 0)
+
+    @property
+    def reuse_rate(self) -> float:
+        return self.reused / self.requests if self.requests else 0.0
+
+
+class ProviderClients:
+    """One long-lived httpx.AsyncClient per provider, with keep-alive pooling.
+
+    Clients are opened by start() in the Application's post_init hook and
+    closed by close() in post_shutdown; get() also opens one on first use
+    so scripts work without the bot. Every request carries an httpcore
+    trace hook that counts new TCP connections, which shows how often the
+    pool is actually reused.
+    """
+
+    def __init__(self, providers: Dict[str, tuple] = PROVIDERS):
+        self.providers = providers
+        self.http2 = HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+        if HTTP2_ENABLED and not self.http2:
+            logger.warning("HTTP2_ENABLED is set but the h2 package is not installed; using HTTP/1.1")
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self.stats: Dict[str, PoolStats] = {name: PoolStats() for name in providers}
+
+    def _open(self, name: str) -> httpx.AsyncClient:
+        base_url, api_key = self.providers[name]
+        stats = self.stats[name]
+
+        async def count_connections(event: str, info: dict):
+            if event == "connection.connect_tcp.started":
+                stats.connections += 1
+
+        async def on_request(request: httpx.Request):
+            stats.requests += 1
+            request.extensions["trace"] = count_connections
+
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {api_key}"
+            },
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            http2=self.http2,
+            event_hooks={"request": [on_request]},
+        )
+
+    def start(self):
+        """Open a client for every provider with an API key."""
+        for name, (_, api_key) in self.providers.items():
+            if api_key and name not in self._clients:
+                self._clients[name] = self._open(name)
+        logger.info(f"Opened HTTP clients for {', '.join(self._clients) or 'no providers'} "
+                    f"({'HTTP/2' if self.http2 else 'HTTP/1.1'}, up to {HTTP_MAX_CONNECTIONS} connections)")
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._clients[name] = self._open(name)
+        return client
+
+    async def close(self):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+    def summary(self, name: str) -> Optional[str]:
+        """One-line reuse stats for a provider, or None if it sent nothing."""
+        stats = self.stats.get(name)
+        if not stats or not stats.requests:
+            return None
+        return (f"{stats.requests} requests, {stats.connections} connections opened, "
+                f"{stats.reuse_rate:.0%} reused")
+
+
+http_clients = ProviderClients()
@@ -0,0 +1,214 @@
+"""
+Rule-based persona: intents, response pools and sticker emotions loaded from persona.json
+"""
+
+import json
+import re
+from bisect import bisect_right
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Optional, Tuple
+import logging
+
+from config import PERSONA_JSON_PATH
+
+logger = logging.getLogger(__name__)
+
+# A relative PERSONA_JSON_PATH is taken from the repo root, wherever the bot is started from
+PERSONA_PATH = str(Path(__file__).resolve().parent.parent / PERSONA_JSON_PATH)
+
+# Used when persona.json cannot be loaded at startup, so rule-based replies keep working
+FALLBACK_PERSONA = {
+    "intents": [],
+    "responses": {},
+    "warmth_responses": {
+        "default": [
+            ["...I see.", "Hmm...", "...Okay.", "Acha."],
+            ["I see what you mean.", "Okay, I get it.", "Acha, theek hai."],
+            ["That's pretty interesting!", "Tell me more yaar."],
+            ["I really enjoy our conversations yaar.", "Tumse baat karke acha lagta hai."],
+        ],
+    },
+}
+
+
+class IntentMatcher:
+    """Find the highest-priority intent in a message with one regex scan.
+
+    Intents are dicts with a name and either a list of keywords or an
+    ends_with suffix, in priority order. All keyword intents are compiled
+    into a single alternation of named groups inside a lookahead. Because
+    the lookahead consumes nothing, finditer tries every word boundary even
+    when keywords overlap, and at each boundary the alternation reports the
+    highest-priority intent starting there.
+    """
+
+    def __init__(self, intents: List[Dict]):
+        self.names = [intent["name"] for intent in intents]
+        self.priority = {name: index for index, name in enumerate(self.names)}
+        self.suffixes = [(index, intent["ends_with"].lower())
+                         for index, intent in enumerate(intents) if intent.get("ends_with")]
+        groups = "|".join(
+            f"(?P<{intent['name']}>{'|'.join(re.escape(keyword.lower()) for keyword in intent['keywords'])})"
+            for intent in intents if intent.get("keywords")
+        )
+        self.pattern = re.compile(rf"\b(?=(?:{groups})\b)") if groups else None
+
+    def _suffix_priority(self, text: str) -> int:
+        for index, suffix in self.suffixes:
+            if text.endswith(suffix):
+                return index
+        return len(self.names)
+
+    def match(self, text: str) -> Optional[str]:
+        """Return the intent for lowercased text, or None for the default."""
+        best = self._suffix_priority(text)
+        if self.pattern is not None:
+            for found in self.pattern.finditer(text):
+                priority = self.priority[found.lastgroup]
+                if priority < best:
+                    best = priority
+                    if best == 0:
+                        break
+        return self.names[best] if best < len(self.names) else None
+
+    def match_many(self, texts: List[str]) -> List[Optional[str]]:
+        """Return the intent for each lowercased text with a single scan over all of them.
+
+        Texts are joined with NUL, which is never part of a keyword and is
+        a word boundary, so matches cannot span two messages.
+        """
+        count = len(self.names)
+        best = [self._suffix_priority(text) for text in texts]
+        starts = []
+        offset = 0
+        for text in texts:
+            starts.append(offset)
+            offset += len(text) + 1
+        priority = self.priority
+        if self.pattern is not None:
+            for found in self.pattern.finditer("\0".join(texts)):
+                index = bisect_right(starts, found.start()) - 1
+                value = priority[found.lastgroup]
+                if value < best[index]:
+                    best[index] = value
+        return [self.names[value] if value < count else None for value in best]
+
+
+class Persona:
+    """A validated persona.json, compiled into matchers and read-only pools.
+
+    Built completely before it is used, so swapping the current persona
+    is a single reference assignment.
+    """
+
+    def __init__(self, data: Dict):
+        validate_persona(data)
+        self.intents: List[Dict] = data["intents"]
+        self.responses: Dict[str, Tuple[str, ...]] = {
+            name: tuple(pool) for name, pool in data["responses"].items()
+        }
+        # Pools by warmth level, coldest first
+        self.warmth_responses: Dict[str, Tuple[Tuple[str, ...], ...]] = {
+            name: tuple(tuple(pool) for pool in tiers) for name, tiers in data["warmth_responses"].items()
+        }
+        self.matcher = IntentMatcher(self.intents)
+        self.emotions = IntentMatcher(data.get("sticker_emotions", []))
+        self.default_emotion: str = data.get("sticker_default", "cool")
+
+    def texts(self) -> FrozenSet[str]:
+        """Every response in the persona's pools."""
+        texts = set()
+        for pool in self.responses.values():
+            texts.update(pool)
+        for tiers in self.warmth_responses.values():
+            for pool in tiers:
+                texts.update(pool)
+        return frozenset(texts)
+
+    @classmethod
+    def load(cls, path: str = PERSONA_PATH) -> "Persona":
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+
+def _check_intents(intents, label: str):
+    if not isinstance(intents, list):
+        raise ValueError(f"{label} must be a list")
+    names = set()
+    for intent in intents:
+        name = intent.get("name") if isinstance(intent, dict) else None
+        if not isinstance(name, str) or not name.isidentifier():
+            raise ValueError(f"{label}: every entry needs a name made of letters, digits and underscores")
+        if name in names:
+            raise ValueError(f"{label}: duplicate name '{name}'")
+        names.add(name)
+        keywords, suffix = intent.get("keywords"), intent.get("ends_with")
+        if (keywords is None) == (suffix is None):
+            raise ValueError(f"{label}: '{name}' needs exactly one of keywords or ends_with")
+        if keywords is not None and (not isinstance(keywords, list) or not keywords
+                                     or not all(isinstance(k, str) and k.strip() for k in keywords)):
+            raise ValueError(f"{label}: '{name}' keywords must be a non-empty list of strings")
+        if suffix is not None and (not isinstance(suffix, str) or not suffix):
+            raise ValueError(f"{label}: '{name}' ends_with must be a non-empty string")
+
+
+def _check_pool(pool, label: str):
+    if not isinstance(pool, list) or not pool or not all(isinstance(text, str) and text for text in pool):
+        raise ValueError(f"{label} must be a non-empty list of strings")
+
+
+def validate_persona(data: Dict):
+    """Raise ValueError describing the first problem in persona data."""
+    if not isinstance(data, dict):
+        raise ValueError("persona must be a JSON object")
+    _check_intents(data.get("intents"), "intents")
+
+    responses = data.get("responses")
+    warmth_responses = data.get("warmth_responses")
+    if not isinstance(responses, dict) or not isinstance(warmth_responses, dict):
+        raise ValueError("responses and warmth_responses must be objects")
+    for name, pool in responses.items():
+        _check_pool(pool, f"responses.{name}")
+    for name, tiers in warmth_responses.items():
+        if not isinstance(tiers, list) or not tiers:
+            raise ValueError(f"warmth_responses.{name} must be a non-empty list of pools")
+        for level, pool in enumerate(tiers):
+            _check_pool(pool, f"warmth_responses.{name}[{level}]")
+    if "default" not in warmth_responses:
+        raise ValueError("warmth_responses.default is required")
+    for intent in data["intents"]:
+        if intent["name"] not in responses and intent["name"] not in warmth_responses:
+            raise ValueError(f"intent '{intent['name']}' has no response pool")
+
+    _check_intents(data.get("sticker_emotions", []), "sticker_emotions")
+    if not isinstance(data.get("sticker_default", "cool"), str):
+        raise ValueError("sticker_default must be a string")
+
+
+def _load_startup_persona() -> Persona:
+    try:
+        persona = Persona.load()
+    except Exception as e:
+        logger.error(f"Failed to load persona from {PERSONA_PATH}, using the built-in fallback: {e}")
+        return Persona(FALLBACK_PERSONA)
+    logger.info(f"Loaded persona with {len(persona.intents)} intents from {PERSONA_PATH}")
+    return persona
+
+
+_persona = _load_startup_persona()
+
+
+def get_persona() -> Persona:
+    return _persona
+
+
+def reload_persona(path: str = PERSONA_PATH) -> Persona:
+    """Load, validate and compile persona.json, then swap it in.
+
+    On any error the current persona stays in place and the error is raised.
+    """
+    global _persona
+    persona = Persona.load(path)
+    _persona = persona
+    logger.info(f"Reloaded persona with {len(persona.intents)} intents from {path}")
+    return persona
@@ -0,0 +1,119 @@
+"""
+Token-budgeted prompt assembly for the LLM providers
+"""
+
+import re
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from config import (MIKU_SYSTEM_PROMPT, MIKU_COMPACT_PROMPT, PROMPT_TOKEN_BUDGET, PROMPT_MAX_MESSAGE_TOKENS,
+                    PROMPT_MAX_TURN_TOKENS, PROMPT_COMPACT)
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+# Role and separator tokens the chat APIs add around each message
+MESSAGE_OVERHEAD = 4
+
+
+def count_tokens(text: str) -> int:
+    """Approximate BPE token count: a token per ~4 characters of a word, one per symbol."""
+    return sum((len(piece) + 3) // 4 for piece in TOKEN_RE.findall(text))
+
+
+def truncate(text: str, max_tokens: int) -> Tuple[str, int]:
+    """Return (text cut to about max_tokens, its token count); cut text ends with "..."."""
+    tokens = 0
+    for match in TOKEN_RE.finditer(text):
+        cost = (len(match.group()) + 3) // 4
+        if tokens + cost > max_tokens:
+            return text[:match.start()].rstrip() + "...", tokens + 1
+        tokens += cost
+    return text, tokens
+
+
+def warmth_note(message_count: int) -> str:
+    return f"\n\n[Internal Note: User has sent {message_count} messages. Adjust warmth accordingly based on the Progressive Warmth System.]"
+
+
+class Prompt:
+    __slots__ = ("system", "turns", "message", "tokens")
+
+    def __init__(self, system: str, turns: List[Tuple[str, str]], message: str, tokens: int):
+        self.system = system
+        # (user message, reply) pairs, oldest first
+        self.turns = turns
+        self.message = message
+        self.tokens = tokens
+
+
+class PromptBuilder:
+    """Fit the system prompt, recent history and the new message into a token budget.
+
+    The user's message is cut to max_message_tokens and each history
+    message to max_turn_tokens. History is then added newest first while
+    it fits the budget. Token counts come from count_tokens, an
+    approximation, so the budget should leave some headroom. The system
+    prompt's count is computed once per prompt text.
+    """
+
+    def __init__(self, budget: int = PROMPT_TOKEN_BUDGET, max_message_tokens: int = PROMPT_MAX_MESSAGE_TOKENS,
+                 max_turn_tokens: int = PROMPT_MAX_TURN_TOKENS, compact: bool = PROMPT_COMPACT):
+        self.budget = budget
+        self.max_message_tokens = max_message_tokens
+        self.max_turn_tokens = max_turn_tokens
+        self.compact = compact
+        self._system_tokens: Dict[str, int] = {}
+        self.requests = 0
+        self.tokens_sent = 0
+        self.truncated = 0
+        self.turns_dropped = 0
+
+    @property
+    def system_prompt(self) -> str:
+        return MIKU_COMPACT_PROMPT if self.compact else MIKU_SYSTEM_PROMPT
+
+    def system_tokens(self, prompt: str) -> int:
+        tokens = self._system_tokens.get(prompt)
+        if tokens is None:
+            tokens = self._system_tokens[prompt] = count_tokens(prompt) + MESSAGE_OVERHEAD
+        return tokens
+
+    def build(self, message: str, history: List[Dict], message_count: int, provider: Optional[str] = None) -> Prompt:
+        """Assemble a prompt from get_chat_history rows (newest first) and log its size."""
+        system = self.system_prompt
+        note = warmth_note(message_count)
+        tokens = self.system_tokens(system) + count_tokens(note)
+
+        text, message_tokens = truncate(message, self.max_message_tokens)
+        tokens += message_tokens + MESSAGE_OVERHEAD
+        truncated = text != message
+
+        turns = []
+        for chat in history:
+            user_text, user_tokens = truncate(chat["message"], self.max_turn_tokens)
+            reply, reply_tokens = truncate(chat["response"], self.max_turn_tokens)
+            cost = user_tokens + reply_tokens + 2 * MESSAGE_OVERHEAD
+            if tokens + cost > self.budget:
+                break
+            turns.append((user_text, reply))
+            tokens += cost
+        turns.reverse()
+
+        self.requests += 1
+        self.tokens_sent += tokens
+        self.truncated += truncated
+        self.turns_dropped += len(history) - len(turns)
+        logger.info(f"Prompt for {provider or 'LLM'}: ~{tokens} tokens, "
+                    f"{len(turns)}/{len(history)} history turns{', message truncated' if truncated else ''}")
+        return Prompt(system + note, turns, text, tokens)
+
+    def summary(self) -> Optional[str]:
+        if not self.requests:
+            return None
+        return (f"{self.requests} prompts, ~{self.tokens_sent // self.requests} tokens avg, "
+                f"{self.truncated} messages cut, {self.turns_dropped} history turns dropped")
+
+
+prompt_builder = PromptBuilder()
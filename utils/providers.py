@@ -0,0 +1,522 @@
+"""
+Reply providers behind one interface, tried in order with circuit breakers and optional hedging
+"""
+
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import logging
+
+from config import (DATABASE_PATH, AI_PROVIDER, PROVIDER_CHAIN, GROQ_API_KEY, COHERE_API_KEY,
+                    RETRIEVAL_INDEX_PATH, RETRIEVAL_MIN_SCORE, PROVIDER_TIMEOUT,
+                    BREAKER_WINDOW, BREAKER_MIN_CALLS, BREAKER_FAILURE_RATE, BREAKER_SLOW_SECONDS,
+                    BREAKER_COOLDOWN, HEDGE_REQUESTS, HEDGE_MIN_DELAY, RESPONSE_CACHE_SIZE)
+from db import get_async_database
+from utils.chat_engine import MikuChatEngine
+from utils.http_clients import http_clients
+from utils.prompt import prompt_builder
+from utils.response_cache import ResponseCache
+from utils.retrieval import RetrievalIndex
+from utils.scheduler import Overloaded, scheduler
+from utils.streaming import iter_sse_data
+
+logger = logging.getLogger(__name__)
+db = get_async_database(DATABASE_PATH)
+
+
+class NoReply(Exception):
+    """A provider had nothing to say; try the next one without counting a failure."""
+
+
+class Provider(ABC):
+    """One source of replies."""
+
+    name = ""
+    # Replies come from a fixed set (stored by response_id in chat_history)
+    canned = False
+    streams = False
+    # Remote providers get timeouts and may be hedged
+    remote = False
+
+    def available(self) -> bool:
+        return True
+
+    @abstractmethod
+    async def generate(self, user_id: int, message: str, message_count: int) -> str:
+        """Return a reply, or raise NoReply to let the next provider answer."""
+
+
+class RemoteProvider(Provider):
+    """An LLM API called through the shared scheduler.
+
+    Subclasses build the request and send it; the chain holds a scheduler
+    slot around the send so its timeout only covers the call itself.
+    """
+
+    streams = True
+    remote = True
+
+    @abstractmethod
+    async def build_request(self, user_id: int, message: str, message_count: int) -> Tuple[dict, int]:
+        """Return (request body, token cost) for one reply."""
+
+    @abstractmethod
+    async def send(self, request: dict) -> str:
+        """Send a request built by build_request() and return the reply."""
+
+    @abstractmethod
+    def send_stream(self, request: dict) -> AsyncIterator[str]:
+        """Send a request built by build_request() and yield the reply as it is generated."""
+
+    def slot(self, user_id: int, tokens: int):
+        return scheduler.slot(self.name, tokens, scheduler.priority_for(user_id))
+
+    async def generate(self, user_id: int, message: str, message_count: int) -> str:
+        request, tokens = await self.build_request(user_id, message, message_count)
+        async with self.slot(user_id, tokens):
+            return await self.send(request)
+
+
+class GroqProvider(RemoteProvider):
+    name = "groq"
+    path = "/openai/v1/chat/completions"
+
+    def available(self) -> bool:
+        return bool(GROQ_API_KEY)
+
+    async def build_request(self, user_id: int, message: str, message_count: int) -> Tuple[dict, int]:
+        """Build the Groq chat completion request body (Llama 3.3 70B Versatile) and its token cost."""
+        history = await db.get_chat_history(user_id, limit=6)  # Increased for better context
+        prompt = prompt_builder.build(message, history, message_count, provider=self.name)
+
+        messages = [{"role": "system", "content": prompt.system}]
+        for user_text, reply in prompt.turns:
+            messages.append({"role": "user", "content": user_text})
+            messages.append({"role": "assistant", "content": reply})
+        messages.append({"role": "user", "content": prompt.message})
+
+        request = {
+            "model": "llama-3.3-70b-versatile",  # Best free model - world-class performance
+            "messages": messages,
+            "max_tokens": 200,  # Reduced for more concise Miku-style responses
+            "temperature": 0.85,  # Slightly higher for personality variation
+            "top_p": 0.95,
+            "frequency_penalty": 0.3,  # Reduce repetition
+            "presence_penalty": 0.2  # Encourage topic diversity
+        }
+        return request, prompt.tokens + request["max_tokens"]
+
+    async def send(self, request: dict) -> str:
+        """Get response from Groq AI with best model (Llama 3.3 70B Versatile)."""
+        response = await http_clients.get(self.name).post(self.path, json=request)
+        response.raise_for_status()
+        data = response.json()
+        return data["choices"][0]["message"]["content"]
+
+    async def send_stream(self, request: dict) -> AsyncIterator[str]:
+        """Yield the Groq response as it is generated (OpenAI-compatible SSE)."""
+        async with http_clients.get(self.name).stream("POST", self.path, json={**request, "stream": True}) as response:
+            response.raise_for_status()
+            async for event in iter_sse_data(response):
+                for choice in event.get("choices", []):
+                    yield (choice.get("delta") or {}).get("content") or ""
+
+
+class CohereProvider(RemoteProvider):
+    name = "cohere"
+    path = "/v2/chat"
+
+    def available(self) -> bool:
+        return bool(COHERE_API_KEY)
+
+    async def build_request(self, user_id: int, message: str, message_count: int) -> Tuple[dict, int]:
+        """Build the Cohere chat request body (Command R+ 08-2024) and its token cost."""
+        history = await db.get_chat_history(user_id, limit=5)
+        prompt = prompt_builder.build(message, history, message_count, provider=self.name)
+
+        chat_history = []
+        for user_text, reply in prompt.turns:
+            chat_history.append({"role": "USER", "message": user_text})
+            chat_history.append({"role": "CHATBOT", "message": reply})
+
+        request = {
+            "model": "command-r-plus-08-2024",  # Best available Cohere model
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt.message
+                }
+            ],
+            "chat_history": chat_history,
+            "preamble": prompt.system,
+            "temperature": 0.85,
+            "max_tokens": 200,
+            "frequency_penalty": 0.3,
+            "presence_penalty": 0.2
+        }
+        return request, prompt.tokens + request["max_tokens"]
+
+    async def send(self, request: dict) -> str:
+        """Get response from Cohere AI with best model (Command R+ 08-2024)."""
+        response = await http_clients.get(self.name).post(self.path, json=request)
+        response.raise_for_status()
+        data = response.json()
+
+        # Extract text from the new response format
+        if "message" in data and "content" in data["message"]:
+            for content in data["message"]["content"]:
+                if content.get("type") == "text":
+                    return content.get("text", "...I don't know what to say.")
+
+        return "...Something went wrong."
+
+    async def send_stream(self, request: dict) -> AsyncIterator[str]:
+        """Yield the Cohere response as it is generated (content-delta events)."""
+        async with http_clients.get(self.name).stream("POST", self.path, json={**request, "stream": True}) as response:
+            response.raise_for_status()
+            async for event in iter_sse_data(response):
+                if event.get("type") == "content-delta":
+                    yield event["delta"]["message"]["content"].get("text", "")
+
+
+class RetrievalProvider(Provider):
+    """Best-matching past LLM reply from the index built by scripts.build_retrieval_index."""
+
+    name = "retrieval"
+
+    def __init__(self, path: str = RETRIEVAL_INDEX_PATH, min_score: float = RETRIEVAL_MIN_SCORE):
+        self.min_score = min_score
+        try:
+            self.index = RetrievalIndex.load(path)
+            logger.info(f"Loaded retrieval index with {len(self.index)} past replies from {path}")
+        except Exception as e:
+            logger.warning(f"Retrieval index unavailable: {e}")
+            self.index = None
+
+    def available(self) -> bool:
+        return self.index is not None
+
+    async def generate(self, user_id: int, message: str, message_count: int) -> str:
+        response = self.index.query(message, self.min_score)
+        if response is None:
+            raise NoReply("no past message is close enough")
+        return response
+
+
+class RuleBasedProvider(Provider):
+    """The persona's intent and response pools (100% free, never fails)."""
+
+    name = "rule-based"
+    canned = True
+
+    def __init__(self, engine: Optional[MikuChatEngine] = None):
+        self.engine = engine or MikuChatEngine()
+
+    async def generate(self, user_id: int, message: str, message_count: int) -> str:
+        return self.engine.get_response(message, user_id, message_count)
+
+
+class CircuitBreaker:
+    """Stop calling a provider whose recent calls mostly failed or were slow.
+
+    Opens when at least failure_rate of the last `window` calls (and at
+    least min_calls) failed or took slow_seconds or more. After cooldown
+    one trial call is let through: success closes the breaker, failure
+    opens it for another cooldown.
+    """
+
+    def __init__(self, name: str, window: int = BREAKER_WINDOW, min_calls: int = BREAKER_MIN_CALLS,
+                 failure_rate: float = BREAKER_FAILURE_RATE, slow_seconds: float = BREAKER_SLOW_SECONDS,
+                 cooldown: float = BREAKER_COOLDOWN):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_seconds = slow_seconds
+        self.cooldown = cooldown
+        # (ok, seconds) of recent calls
+        self.results = deque(maxlen=window)
+        self.opened_at: Optional[float] = None
+        self.trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def ready(self) -> bool:
+        """True if a call would be allowed (does not claim the half-open trial)."""
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self.trial)
+
+    def allow(self) -> bool:
+        """Claim permission for one call."""
+        if not self.ready():
+            return False
+        if self.opened_at is not None:
+            self.trial = True
+        return True
+
+    def release(self):
+        """Give back a claimed call that was cancelled before finishing."""
+        self.trial = False
+
+    def record(self, ok: bool, seconds: float):
+        bad = not ok or seconds >= self.slow_seconds
+        self.results.append((not bad, seconds))
+        if self.trial:
+            self.trial = False
+            if bad:
+                self.opened_at = time.monotonic()
+                logger.warning(f"Circuit for {self.name} stays open: trial call failed")
+            else:
+                logger.info(f"Circuit for {self.name} closed: trial call succeeded")
+                self.opened_at = None
+                self.results.clear()
+            return
+        if self.opened_at is None and len(self.results) >= self.min_calls:
+            failures = sum(1 for good, _ in self.results if not good)
+            if failures / len(self.results) >= self.failure_rate:
+                self.opened_at = time.monotonic()
+                logger.warning(f"Circuit for {self.name} opened after {failures}/{len(self.results)} failed or slow calls")
+
+    def p95(self) -> Optional[float]:
+        """95th percentile latency of recent successful calls, once there are enough."""
+        latencies = sorted(seconds for good, seconds in self.results if good)
+        if len(latencies) < self.min_calls:
+            return None
+        return latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+
+
+class ProviderStats:
+    __slots__ = ("served", "failed", "hedged", "hedge_wins")
+
+    def __init__(self):
+        self.served = 0
+        self.failed = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+
+class ProviderChain:
+    """Try providers in order until one replies.
+
+    Providers that are unavailable (no API key, no index) or whose circuit
+    breaker is open are skipped. Remote calls are capped at `timeout`.
+    With hedging on, if a remote provider has not answered by its recent
+    p95 latency, the next remote provider is started too and the first
+    reply wins; local providers are never hedged, they are only the last
+    resort.
+
+    With a ResponseCache, replies from remote providers are cached and
+    short common messages are answered from it before any provider is
+    called (also while the remote providers' breakers are open).
+    """
+
+    def __init__(self, providers: List[Provider], timeout: float = PROVIDER_TIMEOUT,
+                 hedge: bool = HEDGE_REQUESTS, hedge_min_delay: float = HEDGE_MIN_DELAY,
+                 cache: Optional[ResponseCache] = None):
+        self.providers = providers
+        self.cache = cache
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.breakers: Dict[str, CircuitBreaker] = {provider.name: CircuitBreaker(provider.name) for provider in providers}
+        self.stats: Dict[str, ProviderStats] = {provider.name: ProviderStats() for provider in providers}
+
+    def _ready(self, provider: Provider, skip: Optional[Provider] = None) -> bool:
+        return provider is not skip and provider.available() and self.breakers[provider.name].ready()
+
+    def first_available(self) -> Optional[Provider]:
+        """The provider generate() would try first."""
+        for provider in self.providers:
+            if self._ready(provider):
+                return provider
+        return None
+
+    async def _cache_key(self, user_id: int, message: str, message_count: int) -> Optional[tuple]:
+        """Response cache key, or None if the cache is off or does not apply."""
+        if self.cache is None or not self.cache.cacheable(message):
+            return None
+        if not any(provider.remote and provider.available() for provider in self.providers):
+            return None
+        history = await db.get_chat_history(user_id, limit=self.cache.history) if self.cache.history else []
+        return self.cache.key(message, message_count, history)
+
+    async def _attempt(self, provider: Provider, user_id: int, message: str, message_count: int) -> str:
+        breaker = self.breakers[provider.name]
+        started = time.monotonic()
+        try:
+            if provider.remote:
+                request, tokens = await provider.build_request(user_id, message, message_count)
+                async with provider.slot(user_id, tokens):
+                    started = time.monotonic()
+                    response = await asyncio.wait_for(provider.send(request), self.timeout)
+            else:
+                response = await provider.generate(user_id, message, message_count)
+        except (NoReply, Overloaded, asyncio.CancelledError):
+            breaker.release()
+            raise
+        except Exception:
+            breaker.record(False, time.monotonic() - started)
+            self.stats[provider.name].failed += 1
+            raise
+        breaker.record(True, time.monotonic() - started)
+        return response
+
+    def _hedge_delay(self, provider: Provider) -> Optional[float]:
+        if not self.hedge or not provider.remote:
+            return None
+        p95 = self.breakers[provider.name].p95()
+        return None if p95 is None else max(p95, self.hedge_min_delay)
+
+    async def generate(self, user_id: int, message: str, message_count: int,
+                       skip: Optional[Provider] = None, remote: bool = True) -> Tuple[str, Optional[Provider]]:
+        """Return (response, provider that produced it); raise the last error if all fail.
+
+        The provider is None for a reply from the response cache.
+
+        With remote=False (or once the LLM scheduler sheds the request)
+        only local providers are tried.
+        """
+        key = await self._cache_key(user_id, message, message_count)
+        response = self.cache.get(key) if key is not None else None
+        if response is not None:
+            return response, None
+
+        queue = [
+            provider for provider in self.providers
+            if provider is not skip and (remote or not provider.remote)
+        ]
+        pending: Dict[asyncio.Task, Provider] = {}
+        hedged = False
+        hedge_task = None
+        last_error: Exception = RuntimeError("no reply provider is available")
+
+        def start_next(remote_only: bool = False) -> Optional[asyncio.Task]:
+            while queue:
+                if remote_only and not queue[0].remote:
+                    return None
+                provider = queue.pop(0)
+                if provider.available() and self.breakers[provider.name].allow():
+                    task = asyncio.create_task(self._attempt(provider, user_id, message, message_count))
+                    pending[task] = provider
+                    return task
+            return None
+
+        try:
+            while True:
+                if not pending and start_next() is None:
+                    raise last_error
+                delay = None
+                if not hedged and len(pending) == 1 and queue and queue[0].remote:
+                    delay = self._hedge_delay(next(iter(pending.values())))
+                done, _ = await asyncio.wait(pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # The primary is past its p95; race the next remote provider against it
+                    hedged = True
+                    hedge_task = start_next(remote_only=True)
+                    if hedge_task is not None:
+                        self.stats[pending[hedge_task].name].hedged += 1
+                    continue
+                for task in done:
+                    provider = pending.pop(task)
+                    if task.exception() is None:
+                        self.stats[provider.name].served += 1
+                        if task is hedge_task:
+                            self.stats[provider.name].hedge_wins += 1
+                        if provider.remote and key is not None:
+                            self.cache.put(key, task.result())
+                        return task.result(), provider
+                    last_error = task.exception()
+                    if isinstance(last_error, Overloaded):
+                        # Every remote provider shares the scheduler; go straight to the local ones
+                        logger.info(f"Shed {provider.name} request: {last_error}")
+                        queue[:] = [queued for queued in queue if not queued.remote]
+                    elif not isinstance(last_error, NoReply):
+                        logger.warning(f"Provider {provider.name} failed: {last_error!r}")
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def stream(self, provider: RemoteProvider, user_id: int, message: str,
+                     message_count: int) -> AsyncIterator[str]:
+        """Stream from one provider, recording the outcome with its circuit breaker.
+
+        A cached reply is yielded whole without calling the provider.
+        """
+        key = await self._cache_key(user_id, message, message_count)
+        response = self.cache.get(key) if key is not None else None
+        if response is not None:
+            yield response
+            return
+
+        breaker = self.breakers[provider.name]
+        if not breaker.allow():
+            raise RuntimeError(f"{provider.name} circuit is open")
+        started = time.monotonic()
+        chunks = []
+        try:
+            request, tokens = await provider.build_request(user_id, message, message_count)
+            async with provider.slot(user_id, tokens):
+                started = time.monotonic()
+                async for chunk in provider.send_stream(request):
+                    chunks.append(chunk)
+                    yield chunk
+        except (asyncio.CancelledError, GeneratorExit, Overloaded):
+            breaker.release()
+            raise
+        except Exception:
+            breaker.record(False, time.monotonic() - started)
+            self.stats[provider.name].failed += 1
+            raise
+        breaker.record(True, time.monotonic() - started)
+        self.stats[provider.name].served += 1
+        if key is not None:
+            self.cache.put(key, "".join(chunks).strip())
+
+    def summary(self) -> List[str]:
+        """One line per provider that is configured or has been used."""
+        lines = []
+        for provider in self.providers:
+            stats = self.stats[provider.name]
+            if not provider.available() and not stats.served and not stats.failed:
+                continue
+            line = f"{provider.name}: {self.breakers[provider.name].state}, {stats.served} served, {stats.failed} failed"
+            if stats.hedged:
+                line += f", {stats.hedge_wins}/{stats.hedged} hedges won"
+            lines.append(line)
+        if self.cache is not None:
+            cache = self.cache.summary()
+            if cache:
+                lines.append(f"cache: {cache}")
+        return lines
+
+
+PROVIDER_TYPES = {
+    "groq": GroqProvider,
+    "cohere": CohereProvider,
+    "retrieval": RetrievalProvider,
+    "rule-based": RuleBasedProvider,
+}
+
+
+def build_chain(names: Optional[List[str]] = None) -> ProviderChain:
+    """Build the chain from PROVIDER_CHAIN, or AI_PROVIDER followed by rule-based."""
+    if names is None:
+        names = PROVIDER_CHAIN or [AI_PROVIDER]
+    if "rule-based" not in names:
+        names = [*names, "rule-based"]
+    providers = []
+    for name in dict.fromkeys(names):
+        if name not in PROVIDER_TYPES:
+            logger.warning(f"Unknown reply provider '{name}' ignored")
+            continue
+        providers.append(PROVIDER_TYPES[name]())
+    logger.info(f"Reply providers: {' -> '.join(provider.name for provider in providers)}")
+    return ProviderChain(providers, cache=ResponseCache() if RESPONSE_CACHE_SIZE > 0 else None)
+
+
+providers = build_chain()
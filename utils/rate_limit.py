@@ -21,12 +21,12 @@ def rate_limit(func):
     """Decorator to rate limit user messages (admins are exempt)."""
 
     @wraps(func)
-    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
         user_id = update.effective_user.id
 
         # Admins and owner bypass rate limit
         if is_admin(user_id):
-            return await func(update, context)
+            return await func(update, context, *args, **kwargs)
 
         now = datetime.now()
 
@@ -50,6 +50,6 @@ def rate_limit(func):
         # Add current timestamp
         user_timestamps[user_id].append(now)
 
-        return await func(update, context)
+        return await func(update, context, *args, **kwargs)
 
     return wrapper
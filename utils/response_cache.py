@@ -0,0 +1,143 @@
+"""
+LRU + TTL cache of LLM replies to short, common messages
+"""
+
+import bisect
+import hashlib
+import random
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from config import (RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_VARIANTS, RESPONSE_CACHE_HISTORY,
+                    RESPONSE_CACHE_MAX_WORDS)
+
+WORD_RE = re.compile(r"\w+")
+REPEAT_RE = re.compile(r"(\w)\1{2,}")
+
+# First message count of each Progressive Warmth System phase after the first
+WARMTH_TIERS = (6, 21, 51)
+
+
+def normalize(message: str) -> str:
+    """Lowercase words only, with stretched letters squeezed ("Hiiii!!" -> "hii")."""
+    return " ".join(WORD_RE.findall(REPEAT_RE.sub(r"\1\1", message.lower())))
+
+
+def warmth_tier(message_count: int) -> int:
+    return bisect.bisect_right(WARMTH_TIERS, message_count)
+
+
+def history_digest(history: List[Dict]) -> str:
+    """Short hash of (message, response) pairs, newest first as get_chat_history returns them."""
+    digest = hashlib.blake2b(digest_size=8)
+    for chat in history:
+        digest.update(chat["message"].encode())
+        digest.update(b"\0")
+        digest.update(chat["response"].encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class _Entry:
+    __slots__ = ("created", "variants", "replies", "last")
+
+    def __init__(self, created: float):
+        self.created = created
+        self.variants: List[str] = []
+        # put() calls so far, repeats included
+        self.replies = 0
+        self.last = -1
+
+
+class ResponseCache:
+    """Cached replies keyed by (normalized message, warmth tier, recent history hash).
+
+    A key first collects `variants` LLM replies (each lookup before then
+    is a miss, so the caller asks the provider and put()s the reply);
+    after that lookups are served from the distinct replies collected,
+    never repeating the previous pick when there is more than one. A
+    provider that keeps giving the same reply still fills the key. Keys expire `ttl` seconds after their
+    first reply and the least recently used are evicted past max_size.
+    Only messages of up to max_words words are cached, since longer ones
+    rarely repeat.
+    """
+
+    def __init__(self, max_size: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL,
+                 variants: int = RESPONSE_CACHE_VARIANTS, history: int = RESPONSE_CACHE_HISTORY,
+                 max_words: int = RESPONSE_CACHE_MAX_WORDS, seed: Optional[int] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.variants = max(variants, 1)
+        # Exchanges of recent history that are part of the key
+        self.history = history
+        self.max_words = max_words
+        self.rng = random.Random(seed)
+        self._entries: "OrderedDict[Tuple, _Entry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def cacheable(self, message: str) -> bool:
+        text = normalize(message)
+        return bool(text) and text.count(" ") < self.max_words
+
+    def key(self, message: str, message_count: int, history: List[Dict]) -> Optional[Tuple]:
+        """Cache key for a message, or None if it should not be cached."""
+        if not self.cacheable(message):
+            return None
+        return normalize(message), warmth_tier(message_count), history_digest(history[:self.history])
+
+    def get(self, key: Optional[Tuple]) -> Optional[str]:
+        if key is None:
+            return None
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry.created >= self.ttl:
+            del self._entries[key]
+            entry = None
+        if entry is None or entry.replies < self.variants:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        count = len(entry.variants)
+        if count > 1 and entry.last >= 0:
+            # Any variant but the previous pick
+            choice = self.rng.randrange(count - 1)
+            if choice >= entry.last:
+                choice += 1
+        else:
+            choice = self.rng.randrange(count)
+        entry.last = choice
+        return entry.variants[choice]
+
+    def put(self, key: Optional[Tuple], response: str):
+        if key is None or not response:
+            return
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry(time.monotonic())
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+        if entry.replies >= self.variants:
+            return
+        entry.replies += 1
+        if response not in entry.variants:
+            entry.variants.append(response)
+
+    def summary(self) -> Optional[str]:
+        lookups = self.hits + self.misses
+        if not lookups:
+            return None
+        return f"{len(self)} keys, {self.hits}/{lookups} hits ({self.hit_rate:.0%})"
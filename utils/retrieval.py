@@ -0,0 +1,123 @@
+"""
+Lexical retrieval responder: reply with the past response whose message best matches (BM25)
+"""
+
+import math
+import os
+import pickle
+import random
+import re
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+TOKEN_RE = re.compile(r"\w+")
+
+INDEX_VERSION = 1
+
+# Highest-weight postings kept per term; bounds query time on very common words
+MAX_POSTINGS = 200
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+class RetrievalIndex:
+    """BM25 index from past user messages to the responses they got.
+
+    BM25 term weights are computed once at build time and stored per
+    posting, highest first, so a query only sums precomputed weights over
+    the postings of its own terms. Identical responses are stored once.
+    """
+
+    def __init__(self, postings: Dict[str, Tuple[array, array]], doc_responses: array,
+                 responses: List[str], seed: Optional[int] = None):
+        self.postings = postings
+        self.doc_responses = doc_responses
+        self.responses = responses
+        self.rng = random.Random(seed)
+
+    def __len__(self) -> int:
+        return len(self.doc_responses)
+
+    @classmethod
+    def build(cls, pairs: Iterable[Tuple[str, str]], k1: float = 1.2, b: float = 0.75,
+              max_postings: int = MAX_POSTINGS) -> "RetrievalIndex":
+        """Index (message, response) pairs."""
+        term_docs: Dict[str, Tuple[array, array]] = {}
+        doc_lengths = array('i')
+        doc_responses = array('i')
+        responses: List[str] = []
+        response_ids: Dict[str, int] = {}
+
+        for message, response in pairs:
+            tokens = tokenize(message or "")
+            if not tokens or not response:
+                continue
+            doc = len(doc_lengths)
+            doc_lengths.append(len(tokens))
+            response_id = response_ids.setdefault(response, len(responses))
+            if response_id == len(responses):
+                responses.append(response)
+            doc_responses.append(response_id)
+            for term, count in Counter(tokens).items():
+                docs, counts = term_docs.setdefault(term, (array('i'), array('i')))
+                docs.append(doc)
+                counts.append(count)
+
+        total = len(doc_lengths)
+        average_length = sum(doc_lengths) / total if total else 0.0
+        postings = {}
+        for term, (docs, counts) in term_docs.items():
+            idf = math.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+            weights = [
+                idf * count * (k1 + 1) / (count + k1 * (1 - b + b * doc_lengths[doc] / average_length))
+                for doc, count in zip(docs, counts)
+            ]
+            order = sorted(range(len(docs)), key=weights.__getitem__, reverse=True)[:max_postings]
+            postings[term] = (array('i', (docs[i] for i in order)), array('f', (weights[i] for i in order)))
+
+        return cls(postings, doc_responses, responses)
+
+    def query(self, message: str, min_score: float = 0.0) -> Optional[str]:
+        """Return the response to the best-matching past message, or None below min_score.
+
+        Ties (e.g. the same message answered several ways) are broken at random.
+        """
+        scores: Dict[int, float] = {}
+        get = scores.get
+        for term in set(tokenize(message)):
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            for doc, weight in zip(*entry):
+                scores[doc] = get(doc, 0.0) + weight
+        if not scores:
+            return None
+
+        best = max(scores.values())
+        if best < min_score:
+            return None
+        candidates = [doc for doc, score in scores.items() if score >= best * 0.9999]
+        return self.responses[self.doc_responses[self.rng.choice(candidates)]]
+
+    def save(self, path: str):
+        """Write the index, replacing any existing file atomically."""
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            pickle.dump({
+                "version": INDEX_VERSION,
+                "postings": self.postings,
+                "doc_responses": self.doc_responses,
+                "responses": self.responses,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "RetrievalIndex":
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError(f"{path} was built by an incompatible version; rebuild it")
+        return cls(data["postings"], data["doc_responses"], data["responses"])
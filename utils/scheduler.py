@@ -0,0 +1,225 @@
+"""
+Global scheduler for outbound LLM requests: concurrency cap, per-provider quotas, priority and shedding
+"""
+
+import asyncio
+import contextlib
+import itertools
+import statistics
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import logging
+
+from config import (LLM_MAX_CONCURRENCY, LLM_QUEUE_SIZE, LLM_QUEUE_TIMEOUT, GROQ_RPM, GROQ_TPM, COHERE_RPM,
+                    COHERE_TPM)
+from utils.admin import is_admin
+
+logger = logging.getLogger(__name__)
+
+ADMIN_PRIORITY = 0
+USER_PRIORITY = 1
+
+# Requests and tokens per minute per provider (0 = unlimited)
+QUOTAS = {
+    "groq": (GROQ_RPM, GROQ_TPM),
+    "cohere": (COHERE_RPM, COHERE_TPM),
+}
+
+
+class Overloaded(Exception):
+    """No slot could be had in time; the caller should answer without an LLM."""
+
+
+class TokenBucket:
+    """Allow `per_minute` units per minute, refilled continuously, bursting up to a minute's worth."""
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (amounts over capacity wait for a full bucket)."""
+        self._refill()
+        missing = min(amount, self.capacity) - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "provider", "tokens", "future")
+
+    def __init__(self, priority: int, seq: int, provider: str, tokens: int, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.provider = provider
+        self.tokens = tokens
+        self.future = future
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class LLMScheduler:
+    """Admit provider requests under a global concurrency cap and per-provider RPM/TPM budgets.
+
+    A request that cannot start right away joins a bounded wait queue,
+    ordered by priority (admins first) then arrival. Waiters are admitted
+    as slots free up and their provider's buckets refill; a waiter whose
+    provider is out of quota does not block others. Requests that find
+    the queue full (and no lower-priority waiter to displace), or are
+    still waiting after max_wait seconds, raise Overloaded so the reply
+    can fall back to a local provider.
+    """
+
+    def __init__(self, concurrency: int = LLM_MAX_CONCURRENCY, queue_size: int = LLM_QUEUE_SIZE,
+                 max_wait: float = LLM_QUEUE_TIMEOUT, quotas: Dict[str, Tuple[int, int]] = QUOTAS):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.buckets: Dict[str, Tuple[Optional[TokenBucket], Optional[TokenBucket]]] = {
+            name: (TokenBucket(rpm) if rpm > 0 else None, TokenBucket(tpm) if tpm > 0 else None)
+            for name, (rpm, tpm) in quotas.items()
+        }
+        self.active = 0
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+        self.max_depth = 0
+        self.waits_ms = deque(maxlen=1000)
+
+    @property
+    def depth(self) -> int:
+        return len(self._waiters)
+
+    @staticmethod
+    def priority_for(user_id: int) -> int:
+        return ADMIN_PRIORITY if is_admin(user_id) else USER_PRIORITY
+
+    def _quota_wait(self, provider: str, tokens: int) -> float:
+        requests, token_bucket = self.buckets.get(provider, (None, None))
+        return max(requests.wait_time(1) if requests else 0.0,
+                   token_bucket.wait_time(tokens) if token_bucket else 0.0)
+
+    def _start(self, provider: str, tokens: int):
+        requests, token_bucket = self.buckets.get(provider, (None, None))
+        if requests:
+            requests.take(1)
+        if token_bucket:
+            token_bucket.take(tokens)
+        self.active += 1
+        self.admitted += 1
+
+    def _dispatch(self):
+        """Admit waiters, best priority first, while slots and quota allow."""
+        self._timer = None
+        retry_in = None
+        for waiter in sorted(self._waiters):
+            if waiter.future.done():
+                # Cancelled while queued; its acquire() may not have run yet to remove it
+                self._waiters.remove(waiter)
+                continue
+            if self.active >= self.concurrency:
+                break
+            wait = self._quota_wait(waiter.provider, waiter.tokens)
+            if wait > 0:
+                retry_in = wait if retry_in is None else min(retry_in, wait)
+                continue
+            self._waiters.remove(waiter)
+            self._start(waiter.provider, waiter.tokens)
+            waiter.future.set_result(None)
+        if retry_in is not None and self._waiters and self.active < self.concurrency:
+            self._timer = asyncio.get_running_loop().call_later(retry_in, self._dispatch)
+
+    def _wake(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._dispatch()
+
+    def _expire(self, waiter: _Waiter):
+        if waiter in self._waiters:
+            self._waiters.remove(waiter)
+            if waiter.future.done():
+                return
+            self.shed += 1
+            waiter.future.set_exception(Overloaded(f"waited {self.max_wait:.1f}s for {waiter.provider}"))
+
+    async def acquire(self, provider: str, tokens: int = 0, priority: int = USER_PRIORITY):
+        """Wait for permission to send one request of about `tokens` tokens."""
+        started = time.monotonic()
+        if not self._waiters and self.active < self.concurrency and self._quota_wait(provider, tokens) == 0:
+            self._start(provider, tokens)
+            self.waits_ms.append(0.0)
+            return
+        if len(self._waiters) >= self.queue_size:
+            self._waiters = [waiter for waiter in self._waiters if not waiter.future.done()]
+        if len(self._waiters) >= self.queue_size:
+            worst = max(self._waiters, default=None)
+            if worst is None or worst.priority <= priority:
+                self.shed += 1
+                raise Overloaded(f"{len(self._waiters)} requests already waiting")
+            # Make room by shedding the newest lower-priority waiter
+            self._waiters.remove(worst)
+            self.shed += 1
+            worst.future.set_exception(Overloaded("displaced by a higher-priority request"))
+
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(priority, next(self._seq), provider, tokens, loop.create_future())
+        self._waiters.append(waiter)
+        self.queued += 1
+        self.max_depth = max(self.max_depth, len(self._waiters))
+        deadline = loop.call_later(self.max_wait, self._expire, waiter)
+        self._wake()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                # Admitted just as the caller was cancelled
+                self.release()
+            raise
+        finally:
+            deadline.cancel()
+        self.waits_ms.append((time.monotonic() - started) * 1000)
+
+    def release(self):
+        self.active -= 1
+        if self._waiters:
+            self._wake()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, provider: str, tokens: int = 0, priority: int = USER_PRIORITY) -> AsyncIterator[None]:
+        """Hold a request slot for the duration of the block."""
+        await self.acquire(provider, tokens, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def summary(self) -> Optional[str]:
+        if not self.admitted and not self.shed:
+            return None
+        waits = sorted(self.waits_ms)
+        p95 = waits[min(int(len(waits) * 0.95), len(waits) - 1)] if waits else 0.0
+        median = statistics.median(waits) if waits else 0.0
+        return (f"{self.active}/{self.concurrency} running, {self.depth} queued (max {self.max_depth}), "
+                f"wait p50 {median:.0f}ms / p95 {p95:.0f}ms, {self.queued} queued, {self.shed} shed")
+
+
+scheduler = LLMScheduler()
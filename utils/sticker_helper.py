@@ -1,9 +1,10 @@
 
+import asyncio
 import random
-import re
 import json
 import os
 from config import STICKERS_JSON_PATH, STICKER_CHANCE
+from utils.persona import get_persona
 from telegram import Update
 from telegram.ext import ContextTypes
 import logging
@@ -40,39 +41,9 @@ def should_send_sticker() -> bool:
 
 def detect_emotion(message: str, response: str) -> str:
     """Detect emotion from message and response context."""
-    message_lower = message.lower()
-    response_lower = response.lower()
-
-    # Greeting
-    if re.search(r'\b(hi|hello|hey|namaste)\b', message_lower):
-        return "greeting"
-
-    # Happy/positive
-    if re.search(r'\b(happy|excited|great|good|nice|khush|mast|acha)\b', message_lower):
-        return "happy"
-
-    # Annoyed/negative
-    if re.search(r'\b(annoying|irritating|stop|bakwas|chup)\b', message_lower):
-        return "annoyed"
-
-    # Shy/compliments
-    if re.search(r'\b(cute|beautiful|pretty|love|pyar)\b', message_lower):
-        return "shy"
-
-    # Study/serious
-    if re.search(r'\b(study|exam|test|history|padhai)\b', message_lower):
-        return "studying"
-
-    # Music
-    if re.search(r'\b(music|song|listen|gaana)\b', message_lower):
-        return "music"
-
-    # Thinking/questions
-    if message.endswith('?'):
-        return "thinking"
-
-    # Default cool/neutral
-    return "cool"
+    persona = get_persona()
+    # Falls back to the default (cool/neutral)
+    return persona.emotions.match(message.lower()) or persona.default_emotion
 
 
 def get_random_sticker_from_category(category: str) -> str:
@@ -86,24 +57,17 @@ def get_random_sticker_from_category(category: str) -> str:
     return ""
 
 
-async def send_sticker_with_message(
+async def send_sticker(
         update: Update,
         context: ContextTypes.DEFAULT_TYPE,
         text: str,
         message: str
-) -> None:
-    """Send a sticker with the response if appropriate."""
+) -> bool:
+    """Send a sticker for the message if configured and chosen; return True if one was sent."""
 
-    # Check if stickers are configured
-    if not MIKU_STICKERS:
-        # No stickers configured, just send text
-        await update.message.reply_text(text)
-        return
-
-    # Decide whether to send sticker
-    if not should_send_sticker():
-        await update.message.reply_text(text)
-        return
+    # Check if stickers are configured, then decide whether to send one
+    if not MIKU_STICKERS or not should_send_sticker():
+        return False
 
     # Detect emotion and get appropriate sticker
     emotion = detect_emotion(message, text)
@@ -117,11 +81,22 @@ async def send_sticker_with_message(
     if sticker_id:
         try:
             await update.message.reply_sticker(sticker=sticker_id)
-            # Small delay before text
-            import asyncio
-            await asyncio.sleep(0.3)
+            return True
         except Exception as e:
             logger.error(f"Failed to send sticker: {e}")
+    return False
+
+
+async def send_sticker_with_message(
+        update: Update,
+        context: ContextTypes.DEFAULT_TYPE,
+        text: str,
+        message: str
+) -> None:
+    """Send a sticker with the response if appropriate."""
+    if await send_sticker(update, context, text, message):
+        # Small delay before text
+        await asyncio.sleep(0.3)
 
     # Always send the text
     await update.message.reply_text(text)
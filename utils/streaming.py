@@ -0,0 +1,137 @@
+"""
+Streaming LLM replies: SSE parsing and progressive Telegram message edits
+"""
+
+import asyncio
+import json
+import statistics
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Dict, Optional
+import logging
+
+import httpx
+from telegram import Message, Update
+from telegram.error import BadRequest, RetryAfter
+
+from config import STREAM_EDIT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+async def iter_sse_data(response: httpx.Response) -> AsyncIterator[Dict]:
+    """Yield the JSON payload of each `data:` line of a server-sent events stream."""
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        if data:
+            yield json.loads(data)
+
+
+class StreamStats:
+    """Time to first byte (first text chunk) and total time of recent streamed replies."""
+
+    def __init__(self, window: int = 1000):
+        self.replies = 0
+        self.ttfb_ms = deque(maxlen=window)
+        self.total_ms = deque(maxlen=window)
+
+    def record(self, ttfb: float, total: float):
+        self.replies += 1
+        self.ttfb_ms.append(ttfb * 1000)
+        self.total_ms.append(total * 1000)
+
+    @staticmethod
+    def _percentile(samples, fraction: float) -> float:
+        ordered = sorted(samples)
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+    def summary(self) -> Optional[str]:
+        if not self.ttfb_ms:
+            return None
+        return (f"{self.replies} replies, first chunk p50 {statistics.median(self.ttfb_ms):.0f}ms / "
+                f"p95 {self._percentile(self.ttfb_ms, 0.95):.0f}ms, "
+                f"complete p50 {statistics.median(self.total_ms):.0f}ms")
+
+
+stream_stats = StreamStats()
+
+
+class StreamingReply:
+    """Send a reply as it is generated, editing one message as text arrives.
+
+    The first non-empty text is sent as soon as it arrives; later text is
+    applied with edits at most every `interval` seconds (Telegram limits
+    edits to roughly one per second per chat), plus a final edit with
+    the complete text. RetryAfter pushes the next edit back instead of
+    failing the reply.
+    """
+
+    def __init__(self, update: Update, interval: float = STREAM_EDIT_INTERVAL,
+                 before_first: Optional[Awaitable] = None):
+        self.update = update
+        self.interval = interval
+        # Awaited before the first message is sent (e.g. a sticker already on its way)
+        self.before_first = before_first
+        self.message: Optional[Message] = None
+        self.sent_text = ""
+        self.next_edit = 0.0
+        self.retry_at = 0.0
+
+    async def _send(self, text: str):
+        if self.before_first is not None:
+            await self.before_first
+            self.before_first = None
+        self.message = await self.update.message.reply_text(text)
+        self.sent_text = text
+        self.next_edit = time.monotonic() + self.interval
+
+    async def _edit(self, text: str):
+        try:
+            await self.message.edit_text(text)
+            self.sent_text = text
+            self.next_edit = time.monotonic() + self.interval
+        except RetryAfter as e:
+            self.retry_at = self.next_edit = time.monotonic() + float(e.retry_after)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+            self.sent_text = text
+
+    async def run(self, chunks: AsyncIterator[str], empty_text: str = "...") -> str:
+        """Consume text chunks, keep the Telegram message up to date and return the full text."""
+        started = time.monotonic()
+        first_chunk = None
+        text = ""
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            if first_chunk is None:
+                first_chunk = time.monotonic()
+            text += chunk
+            if self.message is None:
+                if text.strip():
+                    await self._send(text)
+            elif time.monotonic() >= self.next_edit:
+                await self._edit(text)
+
+        text = text.strip() or empty_text
+        if self.message is None:
+            await self._send(text)
+        else:
+            # The final text must land even if edits are being rate limited
+            for _ in range(3):
+                if text == self.sent_text:
+                    break
+                await asyncio.sleep(max(self.retry_at - time.monotonic(), 0))
+                await self._edit(text)
+
+        finished = time.monotonic()
+        if first_chunk is not None:
+            stream_stats.record(first_chunk - started, finished - started)
+            logger.debug(f"Streamed reply: first chunk after {(first_chunk - started) * 1000:.0f}ms, "
+                         f"done after {(finished - started) * 1000:.0f}ms")
+        return text
@@ -1,12 +1,12 @@
 from functools import wraps
 from telegram import Update
 from telegram.ext import ContextTypes
-from db.database import Database
+from db import get_async_database
 from config import DATABASE_PATH
 import logging
 
 logger = logging.getLogger(__name__)
-db = Database(DATABASE_PATH)
+db = get_async_database(DATABASE_PATH)
 
 
 class UserLevel:
@@ -22,7 +22,7 @@ def check_user_level(required_level: int):
         @wraps(func)
         async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
             user_id = update.effective_user.id
-            user = db.get_user(user_id)
+            user = await db.get_user(user_id)
 
             if not user or user.get("user_level", 0) < required_level:
                 await update.message.reply_text(
@@ -37,17 +37,10 @@ def check_user_level(required_level: int):
     return decorator
 
 
-def get_user_level(user_id: int) -> int:
-    user = db.get_user(user_id)
+async def get_user_level(user_id: int) -> int:
+    user = await db.get_user(user_id)
     return user.get("user_level", 0) if user else 0
 
 
-def set_user_level(user_id: int, level: int):
-    import sqlite3
-    with sqlite3.connect(DATABASE_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE users SET user_level = ? WHERE user_id = ?",
-            (level, user_id)
-        )
-        conn.commit()
\ No newline at end of file
+async def set_user_level(user_id: int, level: int):
+    await db.set_user_level(user_id, level)
\ No newline at end of file